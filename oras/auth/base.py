@@ -22,6 +22,7 @@ class AuthBackend:
 
     session: requests.Session
     _tls_verify: bool
+    token: Optional[str]
 
     def __init__(self, *args, **kwargs):
         self._auths: dict = {}
@@ -2,9 +2,17 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright The ORAS Authors."
 __license__ = "Apache-2.0"
 
+import hashlib
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
 import requests
 
 import oras.auth.utils as auth_utils
+import oras.cache
+import oras.defaults
 from oras.logger import logger
 
 from .base import AuthBackend
@@ -13,14 +21,139 @@ from .base import AuthBackend
 class TokenAuth(AuthBackend):
     """
     Token (OAuth2) style auth.
+
+    Tokens from the registry are kept by (realm, service, scope) until they
+    expire, so going back to a repository (or between pull and push) reuses
+    the token it already has instead of asking for a new one. The realm and
+    service of each registry are remembered from its first challenge, so
+    later requests can get their token up front instead of after a 401.
+    With a token_cache (oras.cache.TokenCache), tokens are shared on disk
+    with other processes too. Threads that need the same token at the same
+    time wait for a single request to the token endpoint. A token set with
+    set_token_auth is sent as is, and only replaced by one from the registry
+    for a request it refused.
     """
 
     def __init__(self):
-        self.token = None
+        # The token last sent, and the one set by the user
+        self.token: Optional[str] = None
+        self._user_token: Optional[str] = None
+        self.token_cache: Optional[oras.cache.TokenCache] = None
+        self._tokens: Dict[Tuple, dict] = {}
+        self._challenges: Dict[str, auth_utils.authHeader] = {}
+        self._token_locks: Dict[Tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
         super().__init__()
 
     def _logout(self):
         self.token = None
+        self._user_token = None
+        with self._lock:
+            self._tokens = {}
+        if self.token_cache:
+            self.token_cache.clear(self._credentials_digest())
+
+    def _credentials_digest(self) -> str:
+        """
+        Get a digest of the credentials tokens are requested with.
+        """
+        credentials = getattr(self, "_basic_auth", None) or ""
+        return hashlib.sha256(credentials.encode("utf-8")).hexdigest()
+
+    def _token_key(self, h: auth_utils.authHeader) -> Tuple:
+        """
+        Get the key of the token for a challenge.
+
+        :param h: the parsed Www-Authenticate header
+        :type h: oras.auth.utils.authHeader
+        """
+        return (h.realm, h.service, auth_utils.normalize_scope(h.scope))
+
+    def get_cached_token(
+        self, h: auth_utils.authHeader, refresh_ahead: bool = True
+    ) -> Optional[str]:
+        """
+        Get a token we already have for a challenge, if it has not expired.
+
+        By default a token about to expire (within the refresh margin) is not
+        returned either, so it gets replaced before a request can fail with it
+        halfway through, e.g., in a long chunked upload.
+
+        :param h: the parsed Www-Authenticate header
+        :type h: oras.auth.utils.authHeader
+        :param refresh_ahead: skip tokens that are about to expire
+        :type refresh_ahead: bool
+        """
+        key = self._token_key(h)
+        now = time.time()
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry and now >= entry["issued_at"] + entry["expires_in"]:
+                del self._tokens[key]
+                entry = None
+
+        # Another process may have got it already, but keep a token another
+        # thread saved while we looked
+        if not entry and self.token_cache:
+            saved = self.token_cache.get(key, self._credentials_digest())
+            if saved:
+                with self._lock:
+                    entry = self._tokens.setdefault(
+                        key,
+                        {
+                            "token": saved[0],
+                            "expires_in": saved[1] - now,
+                            "issued_at": now,
+                        },
+                    )
+
+        if not entry:
+            return None
+        if refresh_ahead:
+            expires = entry["issued_at"] + entry["expires_in"]
+            margin = min(
+                oras.defaults.default_token_refresh_margin, entry["expires_in"] / 4
+            )
+            if now >= expires - margin:
+                return None
+        return entry["token"]
+
+    def _save_token(self, h: auth_utils.authHeader, data: dict) -> Optional[str]:
+        """
+        Save the token of a token response for the challenge it answers.
+
+        The expiry is counted from when we got the token, by our own clock,
+        so clock skew with the registry does not matter.
+
+        :param h: the parsed Www-Authenticate header
+        :type h: oras.auth.utils.authHeader
+        :param data: the token response
+        :type data: dict
+        """
+        # We can get token OR access_token OR both (when both they are identical)
+        token = data.get("token") or data.get("access_token")
+        if not token:
+            return None
+        try:
+            expires_in = int(data.get("expires_in") or 0)
+        except (TypeError, ValueError):
+            expires_in = 0
+        key = self._token_key(h)
+        entry = {
+            "token": token,
+            "expires_in": expires_in or oras.defaults.default_token_expires_in,
+            "issued_at": time.time(),
+        }
+        with self._lock:
+            self._tokens[key] = entry
+        if self.token_cache:
+            self.token_cache.set(
+                key,
+                self._credentials_digest(),
+                token,
+                entry["issued_at"] + entry["expires_in"],
+            )
+        return token
 
     def set_token_auth(self, token: str):
         """
@@ -29,13 +162,86 @@ class TokenAuth(AuthBackend):
         :param token: the bearer token
         :type token: str
         """
-        self.token = token
+        self.token = self._user_token = token
 
     def get_auth_header(self):
-        if self.token:
-            return {"Authorization": "Bearer %s" % self.token}
+        if self._user_token:
+            return {"Authorization": "Bearer %s" % self._user_token}
         return {}
 
+    def get_request_auth_header(self, url: str, method: str = "GET") -> dict:
+        """
+        Get the auth header for a request, getting its token if needed.
+
+        If the registry challenged us before, we know where to ask for a
+        token and can work out the scope, so we can skip the 401. Otherwise,
+        if we cannot get one, or with a token set by the user, this is the
+        same as get_auth_header.
+
+        :param url: the URL of the request
+        :type url: str
+        :param method: the method of the request
+        :type method: str
+        """
+        if self._user_token:
+            return self.get_auth_header()
+        host = urlparse(url).netloc
+        challenge = self._challenges.get(host)
+        if not challenge and self.token_cache:
+            saved = self.token_cache.get_challenge(host)
+            if saved:
+                challenge = auth_utils.authHeader(
+                    {"realm": saved[0], "service": saved[1]}
+                )
+                self._challenges[host] = challenge
+        scope = auth_utils.get_scope(url, method)
+        if challenge and scope:
+            h = auth_utils.authHeader(
+                {"realm": challenge.realm, "service": challenge.service}
+            )
+            h.scope = scope
+
+            token = self.get_cached_token(h)
+            if not token:
+                # Another thread may have got it while we waited
+                with self._token_lock(h):
+                    token = self.get_cached_token(h) or self._fetch_token(h)
+
+            # A token about to expire is still better than none
+            token = token or self.get_cached_token(h, refresh_ahead=False)
+            if token:
+                self.token = token
+                return {"Authorization": "Bearer %s" % token}
+        return self.get_auth_header()
+
+    def _token_lock(self, h: auth_utils.authHeader) -> threading.Lock:
+        """
+        Get the lock held while asking for the token of a challenge.
+
+        :param h: the parsed Www-Authenticate header
+        :type h: oras.auth.utils.authHeader
+        """
+        key = self._token_key(h)
+        with self._lock:
+            return self._token_locks.setdefault(key, threading.Lock())
+
+    def _fetch_token(self, h: auth_utils.authHeader) -> Optional[str]:
+        """
+        Ask for a token for a challenge, anonymous if we have no basic auth.
+
+        :param h: the parsed Www-Authenticate header
+        :type h: oras.auth.utils.authHeader
+        """
+        # if no basic auth, try by request an anonymous token
+        if not hasattr(self, "_basic_auth"):
+            anon_token = self.request_anonymous_token(h)
+            if anon_token:
+                logger.debug("Successfully obtained anonymous token!")
+                return anon_token
+
+        # basic auth is available, try using auth token
+        return self.request_token(h)
+
     def reset_basic_auth(self):
         """
         Given we have basic auth, reset it.
@@ -67,27 +273,43 @@ class TokenAuth(AuthBackend):
             )
             return headers, False
 
-        # If we have a token, set auth header (base64 encoded user/pass)
-        if self.token:
-            headers["Authorization"] = "Bearer %s" % self.token
-            return headers, True
-
         h = auth_utils.parse_auth_header(authHeaderRaw)
 
-        # if no basic auth, try by request an anonymous token
-        if not hasattr(self, "_basic_auth"):
-            anon_token = self.request_anonymous_token(h)
-            if anon_token:
-                logger.debug("Successfully obtained anonymous token!")
-                self.token = anon_token
-                headers["Authorization"] = "Bearer %s" % self.token
-                return headers, True
+        # Ensure the realm starts with http, so it keys the same token
+        if h.realm and not h.realm.startswith("http"):
+            h.realm = f"{self.prefix}://{h.realm}"
 
-        # basic auth is available, try using auth token
-        token = self.request_token(h)
+        # Remember where this registry sends us for tokens
+        if h.realm and original.url and authHeaderRaw.lower().startswith("bearer"):
+            host = urlparse(original.url).netloc
+            self._challenges[host] = h
+            if self.token_cache:
+                self.token_cache.set_challenge(host, h.realm, h.service)
+
+        # A token set by the user is used until the registry refuses it
+        sent = headers.get("Authorization")
+        user_header = self.get_auth_header().get("Authorization")
+        if user_header and sent != user_header and not refresh:
+            headers["Authorization"] = user_header
+            return headers, True
+
+        # If we have a token for this scope that was not just refused, use it.
+        # Only one thread asks for a new one, the others wait and share it.
+        with self._token_lock(h):
+            token = self.get_cached_token(h)
+            if token and (sent == "Bearer %s" % token or (refresh and not sent)):
+                with self._lock:
+                    self._tokens.pop(self._token_key(h), None)
+                token = None
+            token = token or self._fetch_token(h)
         if token:
             self.token = token
-            headers["Authorization"] = "Bearer %s" % self.token
+            headers["Authorization"] = "Bearer %s" % token
+            return headers, True
+
+        # Fall back to a token set by the user
+        if user_header:
+            headers["Authorization"] = user_header
             return headers, True
 
         logger.error(
@@ -96,7 +318,7 @@ class TokenAuth(AuthBackend):
         )
         return headers, False
 
-    def request_token(self, h: auth_utils.authHeader) -> bool:
+    def request_token(self, h: auth_utils.authHeader) -> Optional[str]:
         """
         Request an authenticated token and save for later.
         """
@@ -140,21 +362,20 @@ class TokenAuth(AuthBackend):
 
         if authResponse.status_code != 200:
             logger.debug(f"Auth response was not successful: {authResponse.text}")
-            return
+            return None
 
         # Request the token
-        info = authResponse.json()
-        return info.get("token") or info.get("access_token")
+        return self._save_token(h, authResponse.json())
 
-    def request_anonymous_token(self, h: auth_utils.authHeader) -> bool:
+    def request_anonymous_token(self, h: auth_utils.authHeader) -> Optional[str]:  # type: ignore
         """
         Given no basic auth, fall back to trying to request an anonymous token.
 
-        Returns: boolean if headers have been updated with token.
+        Returns: the token, if we got one (saved for later too).
         """
         if not h.realm:
             logger.debug("Request anonymous token: no realm provided, exiting early")
-            return
+            return None
 
         params = {}
         if h.service:
@@ -168,14 +389,13 @@ class TokenAuth(AuthBackend):
         )
         if response.status_code != 200:
             logger.debug(f"Response for anon token failed: {response.text}")
-            return
+            return None
 
         # From https://docs.docker.com/registry/spec/auth/token/ section
-        # We can get token OR access_token OR both (when both they are identical)
-        data = response.json()
-        token = data.get("token") or data.get("access_token")
+        token = self._save_token(h, response.json())
 
         # Update the headers but not self.token (expects Basic)
         if token:
             return token
         logger.debug("Warning: no token or access_token present in response.")
+        return None
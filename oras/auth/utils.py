@@ -6,6 +6,7 @@ import base64
 import os
 import re
 from typing import List, Optional
+from urllib.parse import urlparse
 
 import oras.utils
 from oras.logger import logger
@@ -85,3 +86,55 @@ def parse_auth_header(authHeaderRaw: str) -> authHeader:
     for match in matches:
         lookup[match[0]] = match[1]
     return authHeader(lookup)
+
+
+# The name of the repository in a distribution API URL. It is anchored on
+# the end of the path, as a repository name may have blobs/ or manifests/ in it.
+repository_regex = re.compile(
+    "^/v2/(.+)/(blobs/uploads/[^/]*|(blobs|manifests|tags|referrers)/[^/]+)$"
+)
+
+# The actions a request needs, by method. A DELETE is left to the registry,
+# which may ask for delete or * instead of push.
+scope_actions = {
+    "GET": "pull",
+    "HEAD": "pull",
+    "POST": "pull,push",
+    "PUT": "pull,push",
+    "PATCH": "pull,push",
+}
+
+
+def get_scope(url: str, method: str = "GET") -> Optional[str]:
+    """
+    Work out the scope a registry will ask for to allow a request.
+
+    :param url: the URL of the request
+    :type url: str
+    :param method: the method of the request
+    :type method: str
+    """
+    actions = scope_actions.get(method.upper())
+    match = repository_regex.match(urlparse(url).path)
+    if not actions or not match:
+        return None
+    return f"repository:{match.group(1)}:{actions}"
+
+
+def normalize_scope(scope: Optional[str]) -> Optional[str]:
+    """
+    Sort the scopes and their actions, so the same scope reads the same.
+
+    :param scope: a space separated list of type:name:actions scopes
+    :type scope: str
+    """
+    if not scope:
+        return scope
+    scopes = []
+    for item in scope.split():
+        resource, _, actions = item.rpartition(":")
+        if not resource:
+            scopes.append(item)
+            continue
+        scopes.append(f"{resource}:{','.join(sorted(actions.split(',')))}")
+    return " ".join(sorted(scopes))
@@ -0,0 +1,447 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright The ORAS Authors."
+__license__ = "Apache-2.0"
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+import oras.container
+import oras.defaults
+import oras.utils
+
+# Files modified this recently (in nanoseconds) could change again within the
+# same mtime tick without us noticing, so their digests are not cached.
+racy_window_ns = 2 * 10**9
+
+
+class DigestCache:
+    """
+    Remember file digests across runs, keyed by file identity.
+
+    An entry is keyed on (device, inode, size, mtime_ns), so any change to
+    a file gives it a new key and the stale entry simply ages out. The
+    least recently used entries are evicted once the cache grows past
+    max_entries.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_entries: int = oras.defaults.default_digest_cache_entries,
+    ):
+        """
+        Open (or create) the digest cache.
+
+        :param cache_dir: directory to store the cache in
+        :type cache_dir: str
+        :param max_entries: maximum number of digests to keep
+        :type max_entries: int
+        """
+        self.cache_dir = cache_dir or oras.defaults.default_cache_dir
+        self.max_entries = max_entries
+        oras.utils.mkdir_p(self.cache_dir)
+        self.path = os.path.join(self.cache_dir, "digests.db")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS digests "
+            "(key TEXT PRIMARY KEY, digest TEXT NOT NULL, used REAL NOT NULL)"
+        )
+
+    def __repr__(self) -> str:
+        return f"[oras-digest-cache:{self.path}]"
+
+    def get_file_digest(self, path: str, algorithm: str = "sha256") -> Tuple[int, str]:
+        """
+        Return the size and hex digest of a file, hashing it only on a miss.
+
+        :param path: the path to get the size and digest for
+        :type path: str
+        :param algorithm: the algorithm to use
+        :type algorithm: str
+        """
+        st = os.stat(path)
+        key = f"{algorithm}:{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest FROM digests WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                self._db.execute(
+                    "UPDATE digests SET used = ? WHERE key = ?", (time.time(), key)
+                )
+                return st.st_size, row[0]
+
+        size, digest = oras.utils.get_file_digest(path, algorithm)
+
+        # Only trust the key if the file did not change while we read it
+        after = os.stat(path)
+        unchanged = (after.st_size, after.st_mtime_ns) == (size, st.st_mtime_ns)
+        if unchanged and time.time_ns() - st.st_mtime_ns > racy_window_ns:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO digests (key, digest, used) VALUES (?, ?, ?)",
+                    (key, digest, time.time()),
+                )
+                self._evict()
+        return size, digest
+
+    def _evict(self):
+        """
+        Drop the least recently used entries once we are over the limit.
+
+        We remove an extra tenth of the entries so we don't evict on every insert.
+        """
+        count = self._db.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        excess = count - self.max_entries + self.max_entries // 10
+        self._db.execute(
+            "DELETE FROM digests WHERE key IN "
+            "(SELECT key FROM digests ORDER BY used ASC LIMIT ?)",
+            (excess,),
+        )
+
+    def close(self):
+        """
+        Close the underlying database.
+        """
+        with self._lock:
+            self._db.close()
+
+
+class UploadState:
+    """
+    Persist the progress of a chunked upload so it can be resumed.
+
+    The state is a small json file with the session url and the number of
+    bytes the registry acknowledged. It is keyed on the repository and the
+    path, size and mtime of the blob, so a changed file starts over.
+    """
+
+    def __init__(
+        self,
+        blob: str,
+        container: oras.container.Container,
+        cache_dir: Optional[str] = None,
+    ):
+        """
+        Prepare the state file for a blob upload.
+
+        :param blob: path to the blob being uploaded
+        :type blob: str
+        :param container: parsed container URI the blob is uploaded to
+        :type container: oras.container.Container
+        :param cache_dir: directory to store the state in
+        :type cache_dir: str
+        """
+        st = os.stat(blob)
+        identity = "%s/%s:%s:%s:%s" % (
+            container.registry,
+            container.api_prefix,
+            os.path.abspath(blob),
+            st.st_size,
+            st.st_mtime_ns,
+        )
+        name = hashlib.sha256(identity.encode("utf-8")).hexdigest()
+        self.path = os.path.join(
+            cache_dir or oras.defaults.default_cache_dir, "uploads", f"{name}.json"
+        )
+
+    def load(self) -> Optional[dict]:
+        """
+        Load the saved state, if there is a usable one.
+        """
+        try:
+            state = oras.utils.read_json(self.path)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or "session_url" not in state:
+            return None
+        return state
+
+    def save(self, session_url: str, offset: int):
+        """
+        Atomically record the session url and acknowledged offset.
+
+        :param session_url: the upload session url to resume with
+        :type session_url: str
+        :param offset: number of bytes the registry has committed
+        :type offset: int
+        """
+        oras.utils.mkdir_p(os.path.dirname(self.path))
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}"
+        oras.utils.write_json({"session_url": session_url, "offset": offset}, tmp)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        """
+        Remove the state once the upload is done.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class BlobCache:
+    """
+    A local content addressable store of blobs, shared across pulls.
+
+    Blobs live at <cache_dir>/blobs/<algorithm>/<hex> and are only added
+    once their digest was verified. When the total size goes past max_size,
+    the least recently used blobs are removed.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_size: int = oras.defaults.default_blob_cache_size,
+        hardlink: bool = False,
+    ):
+        """
+        Create the blob cache.
+
+        :param cache_dir: directory to store the cache in
+        :type cache_dir: str
+        :param max_size: maximum total size of cached blobs, in bytes
+        :type max_size: int
+        :param hardlink: allow hardlinks between the cache and output files when
+                         a reflink is not possible. Changing such a file in place
+                         also changes the cached blob.
+        :type hardlink: bool
+        """
+        self.root = os.path.join(cache_dir or oras.defaults.default_cache_dir, "blobs")
+        self.max_size = max_size
+        self.hardlink = hardlink
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"[oras-blob-cache:{self.root}]"
+
+    def blob_path(self, digest: str) -> str:
+        """
+        Get the path a blob is stored at.
+
+        :param digest: the digest of the blob, e.g., sha256:<hex>
+        :type digest: str
+        """
+        algorithm, encoded = digest.split(":", 1)
+        if not re.fullmatch("[a-z0-9]+", algorithm) or not re.fullmatch(
+            "[a-f0-9]+", encoded
+        ):
+            raise ValueError(f"{digest} is not a valid digest.")
+        return os.path.join(self.root, algorithm, encoded)
+
+    def get(self, digest: str) -> Optional[str]:
+        """
+        Get the path of a cached blob, or None if it is not cached.
+
+        :param digest: the digest of the blob
+        :type digest: str
+        """
+        path = self.blob_path(digest)
+        try:
+            # Mark it as recently used for eviction
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def materialize(self, digest: str, outfile: str) -> bool:
+        """
+        Place a cached blob at outfile, returning False if it is not cached.
+
+        :param digest: the digest of the blob
+        :type digest: str
+        :param outfile: the path to place the blob at
+        :type outfile: str
+        """
+        path = self.get(digest)
+        if not path:
+            return False
+        try:
+            oras.utils.clone_file(path, outfile, hardlink=self.hardlink)
+        except FileNotFoundError:
+            # Evicted by someone else in the meantime
+            return False
+        return True
+
+    def add(self, digest: str, path: str) -> str:
+        """
+        Add a verified blob to the cache.
+
+        :param digest: the digest of the blob
+        :type digest: str
+        :param path: the path of the blob content
+        :type path: str
+        """
+        target = self.blob_path(digest)
+        if not os.path.exists(target):
+            oras.utils.mkdir_p(os.path.dirname(target))
+            oras.utils.clone_file(path, target, hardlink=self.hardlink)
+            self.evict()
+        return target
+
+    def evict(self):
+        """
+        Remove the least recently used blobs until we are under max_size.
+        """
+        with self._lock:
+            blobs = []
+            for algorithm in os.scandir(self.root):
+                if not algorithm.is_dir():
+                    continue
+                for entry in os.scandir(algorithm.path):
+                    if entry.is_file() and ".tmp-" not in entry.name:
+                        st = entry.stat()
+                        blobs.append((st.st_mtime, st.st_size, entry.path))
+
+            total = sum(size for _, size, _ in blobs)
+            for _, size, path in sorted(blobs):
+                if total <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+class TokenCache:
+    """
+    Keep registry tokens on disk, so short lived processes can share them.
+
+    Tokens are keyed on (realm, service, scope) and a digest of the
+    credentials they were requested with, so a token is never handed to
+    someone using other credentials. The realm and service each registry
+    challenged us with are kept too, so a new process can get its token
+    before its first request. The database is only readable by its owner,
+    and sqlite locks it between processes.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        """
+        Open (or create) the token cache.
+
+        :param cache_dir: directory to store the cache in
+        :type cache_dir: str
+        """
+        self.cache_dir = cache_dir or oras.defaults.default_cache_dir
+        oras.utils.mkdir_p(self.cache_dir)
+        self.path = os.path.join(self.cache_dir, "tokens.db")
+
+        # Create it private before sqlite does, its journal follows the mode
+        os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o600))
+        os.chmod(self.path, 0o600)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, "
+            "credentials TEXT NOT NULL, token TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS challenges "
+            "(host TEXT PRIMARY KEY, realm TEXT NOT NULL, service TEXT)"
+        )
+
+    def __repr__(self) -> str:
+        return f"[oras-token-cache:{self.path}]"
+
+    def _key(self, key: tuple, credentials: str) -> str:
+        return json.dumps([credentials] + list(key))
+
+    def get(self, key: tuple, credentials: str) -> Optional[Tuple[str, float]]:
+        """
+        Get a token and when it expires (in seconds since the epoch).
+
+        :param key: the (realm, service, scope) of the token
+        :type key: tuple
+        :param credentials: digest of the credentials used to get the token
+        :type credentials: str
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT token, expires FROM tokens WHERE key = ?",
+                (self._key(key, credentials),),
+            ).fetchone()
+        if not row or row[1] <= time.time():
+            return None
+        return row[0], row[1]
+
+    def set(self, key: tuple, credentials: str, token: str, expires: float):
+        """
+        Save a token, dropping any that have expired.
+
+        :param key: the (realm, service, scope) of the token
+        :type key: tuple
+        :param credentials: digest of the credentials used to get the token
+        :type credentials: str
+        :param token: the bearer token
+        :type token: str
+        :param expires: when the token expires, in seconds since the epoch
+        :type expires: float
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tokens (key, credentials, token, expires) "
+                "VALUES (?, ?, ?, ?)",
+                (self._key(key, credentials), credentials, token, expires),
+            )
+            self._db.execute("DELETE FROM tokens WHERE expires <= ?", (time.time(),))
+
+    def get_challenge(self, host: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Get the realm and service a registry asks for tokens from.
+
+        :param host: the registry host (and port)
+        :type host: str
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT realm, service FROM challenges WHERE host = ?", (host,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set_challenge(self, host: str, realm: str, service: Optional[str]):
+        """
+        Remember the realm and service a registry asks for tokens from.
+
+        :param host: the registry host (and port)
+        :type host: str
+        :param realm: the url of the token endpoint
+        :type realm: str
+        :param service: the service to ask a token for
+        :type service: str
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO challenges (host, realm, service) "
+                "VALUES (?, ?, ?)",
+                (host, realm, service),
+            )
+
+    def clear(self, credentials: str):
+        """
+        Remove the tokens got with some credentials, e.g., on logout.
+
+        :param credentials: digest of the credentials used to get the tokens
+        :type credentials: str
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM tokens WHERE credentials = ?", (credentials,))
+
+    def close(self):
+        """
+        Close the underlying database.
+        """
+        with self._lock:
+            self._db.close()
@@ -80,8 +80,14 @@ def retry(attempts=5, timeout=2):
     def decorator(func):
         @wraps(func)
         def inner(*args, **kwargs):
+            # A streamed request body must be rewound before it is sent again
+            data = kwargs.get("data")
+            offset = data.tell() if hasattr(data, "seek") else None
+
             attempt = 0
             while attempt < attempts:
+                if offset is not None:
+                    data.seek(offset)
                 try:
                     res = func(*args, **kwargs)
                     if res.status_code == 500:
@@ -103,6 +109,8 @@ def retry(attempts=5, timeout=2):
                     logger.info(f"Retrying in {sleep} seconds - error: {e}")
                     time.sleep(sleep)
                     attempt += 1
+            if offset is not None:
+                data.seek(offset)
             return func(*args, **kwargs)
 
         return inner
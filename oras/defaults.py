@@ -2,6 +2,8 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright The ORAS Authors"
 __license__ = "Apache-2.0"
 
+import os
+
 # Default tag to use
 default_tag = "latest"
 
@@ -17,8 +19,20 @@ class registry:
 # DefaultBlobDirMediaType specifies the default blob directory media type
 default_blob_dir_media_type = "application/vnd.oci.image.layer.v1.tar+gzip"
 
+# Media type of a directory layer compressed with zstd
+default_blob_dir_zstd_media_type = "application/vnd.oci.image.layer.v1.tar+zstd"
+
 # MediaTypeImageLayer is the media type used for layers referenced by the manifest.
 default_blob_media_type = "application/vnd.oci.image.layer.v1.tar"
+
+# Media type of a directory layer, by compression. An uncompressed one
+# is told apart from a file by the annotation_unpack annotation.
+blob_dir_media_types = {
+    "gzip": default_blob_dir_media_type,
+    "zstd": default_blob_dir_zstd_media_type,
+    "none": default_blob_media_type,
+}
+
 unknown_config_media_type = "application/vnd.unknown.config.v1+json"
 default_manifest_media_type = "application/vnd.oci.image.manifest.v1+json"
 
@@ -38,9 +52,45 @@ oci_image_index_file = "index.json"
 # DefaultBlocksize default size of each slice of bytes read in each write through in gunzipand untar.
 default_blocksize = 32768
 
+# Size of the buffer used to read files when computing their digest.
+default_hash_blocksize = 1048576  # 1MB
+
+# Size of each chunk read from the response when downloading blobs.
+default_download_chunksize = 1048576  # 1MB
+
 # DefaultChunkSize default size of each chunk when uploading chunked blobs.
 default_chunksize = 16777216  # 16MB
 
+# Times a chunked upload asks the registry where to continue after a failure
+default_upload_resumes = 3
+
+# Lifetime in seconds of a token that does not give expires_in (as in the
+# distribution token spec)
+default_token_expires_in = 60
+
+# Seconds before it expires that a token is replaced, at most a quarter of
+# its lifetime
+default_token_refresh_margin = 30
+
+# Default compression levels, as for the gzip and zstd commands
+default_gzip_level = 9
+default_zstd_level = 3
+
+# Bytes sampled from the start of each file to decide if a directory is worth
+# compressing, up to a total, and the compressed ratio it needs to get below
+default_compression_sample_size = 65536  # 64KB
+default_compression_sample_total = 1048576  # 1MB
+default_compression_min_ratio = 0.9
+
+# Size of the blocks compressed on their own by parallel gzip
+default_compression_blocksize = 131072  # 128KB
+
+# Largest file written on a pool of threads in a parallel extraction
+default_extract_inline_size = 1048576  # 1MB
+
+# Smallest byte range worth fetching on its own in a segmented download
+default_segment_min_size = 8388608  # 8MB
+
 # what you get for a blank digest, so we don't need to save and recalculate
 blank_hash = "sha256:e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
 
@@ -48,3 +98,15 @@ blank_hash = "sha256:e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b785
 blank_config_hash = (
     "sha256:44136fa355b3678a1146ad16f7e8649e94fb4fc21fe77e8310c060f61caaff8a"
 )
+
+# Directory for the local caches, each of which has to be enabled on the client
+default_cache_dir = os.environ.get("ORAS_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "oras",
+)
+
+# Maximum total size of blobs kept in the blob cache
+default_blob_cache_size = 10737418240  # 10GB
+
+# Maximum number of file digests to remember in the digest cache
+default_digest_cache_entries = 100000
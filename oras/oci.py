@@ -11,6 +11,7 @@ from typing import Dict, Optional, Tuple
 
 import jsonschema
 
+import oras.cache
 import oras.defaults
 import oras.schemas
 import oras.utils
@@ -57,9 +58,29 @@ class Annotations:
         return {}
 
 
+def get_file_digest(
+    path: str, digest_cache: Optional[oras.cache.DigestCache] = None
+) -> Tuple[int, str]:
+    """
+    Get the size and digest of a file, from the digest cache if provided.
+
+    :param path: the path to get the size and digest for
+    :type path: str
+    :param digest_cache: an optional cache of file digests
+    :type digest_cache: oras.cache.DigestCache
+    """
+    if digest_cache is not None:
+        return digest_cache.get_file_digest(path)
+    return oras.utils.get_file_digest(path)
+
+
 class Layer:
     def __init__(
-        self, blob_path: str, media_type: Optional[str] = None, is_dir: bool = False
+        self,
+        blob_path: str,
+        media_type: Optional[str] = None,
+        is_dir: bool = False,
+        digest_cache: Optional[oras.cache.DigestCache] = None,
     ):
         """
         Create a new Layer
@@ -70,8 +91,11 @@ class Layer:
         :type media_type: str
         :param is_dir: is the blob a directory?
         :type is_dir: bool
+        :param digest_cache: cache to look up the blob digest (optional)
+        :type digest_cache: oras.cache.DigestCache
         """
         self.blob_path = blob_path
+        self.digest_cache = digest_cache
         self.set_media_type(media_type, is_dir)
 
     def set_media_type(self, media_type: Optional[str] = None, is_dir: bool = False):
@@ -89,21 +113,30 @@ class Layer:
         elif not is_dir and not media_type:
             self.media_type = oras.defaults.default_blob_media_type
 
-    def to_dict(self):
+    def to_dict(self, compute_digest: bool = True):
         """
         Return a dictionary representation of the layer
+
+        :param compute_digest: read the blob for its size and digest. If False,
+                               they are added once known (e.g., after an upload).
+        :type compute_digest: bool
         """
-        layer = {
-            "mediaType": self.media_type,
-            "size": oras.utils.get_size(self.blob_path),
-            "digest": "sha256:" + oras.utils.get_file_hash(self.blob_path),
-        }
+        layer: Dict[str, object] = {"mediaType": self.media_type}
+        if not compute_digest:
+            return layer
+
+        size, digest = get_file_digest(self.blob_path, self.digest_cache)
+        layer.update({"size": size, "digest": "sha256:" + digest})
         jsonschema.validate(layer, schema=oras.schemas.layer)
         return layer
 
 
 def NewLayer(
-    blob_path: str, media_type: Optional[str] = None, is_dir: bool = False
+    blob_path: str,
+    media_type: Optional[str] = None,
+    is_dir: bool = False,
+    digest_cache: Optional[oras.cache.DigestCache] = None,
+    compute_digest: bool = True,
 ) -> dict:
     """
     Courtesy function to create and retrieve a layer as dict
@@ -114,12 +147,23 @@ def NewLayer(
     :type media_type: str
     :param is_dir: is the blob a directory?
     :type is_dir: bool
+    :param digest_cache: cache to look up the blob digest (optional)
+    :type digest_cache: oras.cache.DigestCache
+    :param compute_digest: read the blob for its size and digest
+    :type compute_digest: bool
     """
-    return Layer(blob_path=blob_path, media_type=media_type, is_dir=is_dir).to_dict()
+    return Layer(
+        blob_path=blob_path,
+        media_type=media_type,
+        is_dir=is_dir,
+        digest_cache=digest_cache,
+    ).to_dict(compute_digest=compute_digest)
 
 
 def ManifestConfig(
-    path: Optional[str] = None, media_type: Optional[str] = None
+    path: Optional[str] = None,
+    media_type: Optional[str] = None,
+    digest_cache: Optional[oras.cache.DigestCache] = None,
 ) -> Tuple[Dict[str, object], Optional[str]]:
     """
     Write an empty config, if one is not provided
@@ -128,6 +172,8 @@ def ManifestConfig(
     :type path: str
     :param media_type: media type for the manifest config (optional)
     :type media_type: str
+    :param digest_cache: cache to look up the config digest (optional)
+    :type digest_cache: oras.cache.DigestCache
     """
     # Create an empty config if we don't have one
     if not path or not os.path.exists(path):
@@ -139,10 +185,11 @@ def ManifestConfig(
         }
 
     else:
+        size, digest = get_file_digest(path, digest_cache)
         conf = {
             "mediaType": media_type or oras.defaults.unknown_config_media_type,
-            "size": oras.utils.get_size(path),
-            "digest": "sha256:" + oras.utils.get_file_hash(path),
+            "size": size,
+            "digest": "sha256:" + digest,
         }
 
     jsonschema.validate(conf, schema=oras.schemas.layer)
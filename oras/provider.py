@@ -3,20 +3,37 @@ __copyright__ = "Copyright The ORAS Authors."
 __license__ = "Apache-2.0"
 
 import copy
+import functools
+import hashlib
 import os
+import re
 import sys
+import threading
 import urllib
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 from contextlib import contextmanager, nullcontext
 from dataclasses import asdict
 from http.cookiejar import DefaultCookiePolicy
 from tempfile import TemporaryDirectory
-from typing import Callable, Generator, List, Optional, Tuple, Union
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Generator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import jsonschema
 import requests
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
 
 import oras.auth
 import oras.auth.utils
+import oras.cache
 import oras.container
 import oras.decorator as decorator
 import oras.defaults
@@ -24,11 +41,23 @@ import oras.main.login as login
 import oras.oci
 import oras.schemas
 import oras.utils
+import oras.utils.compression
 from oras.logger import logger
 from oras.types import container_type
 from oras.utils.fileio import PathAndOptionalContent
 
 
+class ConcurrentOperationsError(ValueError):
+    """
+    Raised when more than one of a set of concurrent operations failed.
+    """
+
+    def __init__(self, errors: List[Exception], total: int):
+        self.errors = errors
+        summary = "; ".join(str(e) for e in errors)
+        super().__init__(f"{len(errors)} of {total} operations failed: {summary}")
+
+
 @contextmanager
 def temporary_empty_config() -> Generator[str, None, None]:
     with TemporaryDirectory() as tmpdir:
@@ -51,6 +80,10 @@ class Registry:
         insecure: bool = False,
         tls_verify: Union[bool, str] = True,
         auth_backend: str = "token",
+        digest_cache: Union[bool, str] = False,
+        blob_cache: Union[bool, str] = False,
+        blob_cache_hardlink: bool = False,
+        token_cache: Union[bool, str] = False,
     ):
         """
         Create an ORAS client.
@@ -65,12 +98,40 @@ class Registry:
         :type tls_verify: bool
         :param auth_backend: name of the auth backend to use
         :type auth_backend: str
+        :param digest_cache: remember file digests on disk between pushes. Set
+                             to True for the default cache directory, or a path.
+        :type digest_cache: bool or str
+        :param blob_cache: keep verified blobs in a local content addressable
+                           store, shared across pulls. Set to True for the
+                           default cache directory, or a path.
+        :type blob_cache: bool or str
+        :param blob_cache_hardlink: let the blob cache hardlink blobs into place
+                                    when a reflink is not possible. Changing
+                                    such a file in place changes the cached
+                                    blob too.
+        :type blob_cache_hardlink: bool
+        :param token_cache: share registry tokens on disk with other processes
+                            until they expire (token auth only). Set to True for
+                            the default cache directory, or a path.
+        :type token_cache: bool or str
         """
         self.hostname: Optional[str] = hostname
         self.headers: dict = {}
         self.session: requests.Session = requests.Session()
         self.prefix: str = "http" if insecure else "https"
         self._tls_verify = tls_verify
+        self._pool_maxsize: int = DEFAULT_POOLSIZE
+        self._pool_lock = threading.Lock()
+        self.digest_cache: Optional[oras.cache.DigestCache] = None
+        if digest_cache:
+            cache_dir = digest_cache if isinstance(digest_cache, str) else None
+            self.digest_cache = oras.cache.DigestCache(cache_dir)
+        self.blob_cache: Optional[oras.cache.BlobCache] = None
+        if blob_cache:
+            cache_dir = blob_cache if isinstance(blob_cache, str) else None
+            self.blob_cache = oras.cache.BlobCache(
+                cache_dir, hardlink=blob_cache_hardlink
+            )
 
         if not tls_verify:
             requests.packages.urllib3.disable_warnings()  # type: ignore
@@ -84,6 +145,9 @@ class Registry:
         self.auth = oras.auth.get_auth_backend(
             auth_backend, self.session, insecure, tls_verify=tls_verify
         )
+        if token_cache and isinstance(self.auth, oras.auth.TokenAuth):
+            cache_dir = token_cache if isinstance(token_cache, str) else None
+            self.auth.token_cache = oras.cache.TokenCache(cache_dir)
 
         # Load all authentication configs once during initialization
         # This avoids re-reading the docker config file for each operation
@@ -225,6 +289,71 @@ class Registry:
         """
         self.headers.update({name: value})
 
+    def _ensure_pool_size(self, max_workers: int):
+        """
+        Make sure the shared session can keep a connection open per worker.
+
+        The default requests adapter holds 10 connections per host, so more
+        workers than that would churn through new connections. We mount one
+        adapter sized to the worker count and share it for all operations.
+        It is only ever replaced by a larger one, so callers that nest pools
+        (e.g., segmented downloads in pull workers) size it for all of them
+        up front, and the nested calls leave it alone.
+
+        :param max_workers: number of threads that will use the session
+        :type max_workers: int
+        """
+        with self._pool_lock:
+            if max_workers <= self._pool_maxsize:
+                return
+            adapter = HTTPAdapter(pool_maxsize=max_workers)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+            self._pool_maxsize = max_workers
+
+    def _run_concurrently(
+        self, calls: Sequence[Callable[[], Any]], max_workers: int = 1
+    ) -> list:
+        """
+        Run each call (e.g., a functools.partial), returning results in order.
+
+        With more than one worker the calls are run in a thread pool. The
+        first failure cancels any work that has not started yet. A single
+        failure is raised as is, as it would be without a pool, and several
+        are reported together in a ConcurrentOperationsError.
+
+        :param calls: list of functions to call without arguments
+        :type calls: list
+        :param max_workers: maximum number of calls to run at once
+        :type max_workers: int
+        """
+        if max_workers <= 1 or len(calls) <= 1:
+            return [call() for call in calls]
+
+        self._ensure_pool_size(max_workers)
+        results: list = [None] * len(calls)
+        errors = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(call) for call in calls]
+            _, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in pending:
+                future.cancel()
+
+            # Wait for anything already running before we report
+            for idx, future in enumerate(futures):
+                if future.cancelled():
+                    continue
+                try:
+                    results[idx] = future.result()
+                except Exception as e:
+                    errors.append(e)
+
+        if len(errors) == 1:
+            raise errors[0]
+        if errors:
+            raise ConcurrentOperationsError(errors, len(calls)) from errors[0]
+        return results
+
     def _validate_path(self, path: str) -> bool:
         """
         Ensure a blob path is in the present working directory or below.
@@ -263,6 +392,7 @@ class Registry:
         layer: dict,
         do_chunked: bool = False,
         chunk_size: int = oras.defaults.default_chunksize,
+        resumable: Union[bool, str] = False,
     ) -> requests.Response:
         """
         Prepare and upload a blob.
@@ -275,16 +405,24 @@ class Registry:
         :type blob: str
         :param container:  parsed container URI
         :type container: oras.container.Container or str
-        :param layer: dict from oras.oci.NewLayer
+        :param layer: dict from oras.oci.NewLayer. Without a digest, it is
+                      computed and added during a chunked upload.
         :type layer: dict
         :param do_chunked: if true do chunked blob upload. This allows upload of larger oci artifacts.
         :type do_chunked: bool
         :param chunk_size: if true use chunked upload.
         :type chunk_size: int
+        :param resumable: save chunked upload progress to resume later. Set to
+                          True for the default cache directory, or a path.
+        :type resumable: bool or str
         """
         blob = os.path.abspath(blob)
 
-        if self.blob_exists(layer, container):
+        # We can only check for an existing blob if we know its digest
+        if "digest" not in layer:
+            if not do_chunked:
+                raise ValueError("A layer without a digest requires a chunked upload.")
+        elif self.blob_exists(layer, container):
             logger.debug(f'layer already exists: {layer["digest"]}')
             response = requests.Response()
             response.status_code = 200
@@ -301,6 +439,7 @@ class Registry:
                 container,
                 layer,
                 chunk_size=chunk_size,
+                resumable=resumable,
             )
 
         # If we have an empty layer digest and the registry didn't accept, just return dummy successful response
@@ -394,7 +533,7 @@ class Registry:
 
         # get all results using the pagination
         while True:
-            response = self.do_request(url, "GET", headers=self.headers)
+            response = self.do_request(url, "GET", headers=dict(self.headers))
 
             # Check 200 response, show errors if any
             self._check_200_response(response)
@@ -420,6 +559,7 @@ class Registry:
         digest: str,
         stream: bool = False,
         head: bool = False,
+        headers: Optional[dict] = None,
     ) -> requests.Response:
         """
         Retrieve a blob for a package.
@@ -432,10 +572,13 @@ class Registry:
         :type stream: bool
         :param head: use head to determine if blob exists
         :type head: bool
+        :param headers: extra headers for the request (e.g., a Range)
+        :type headers: dict
         """
         method = "GET" if not head else "HEAD"
         blob_url = f"{self.prefix}://{container.get_blob_url(digest)}"  # type: ignore
-        return self.do_request(blob_url, method, headers=self.headers, stream=stream)
+        headers = {**self.headers, **(headers or {})}
+        return self.do_request(blob_url, method, headers=headers, stream=stream)
 
     def get_container(self, name: container_type) -> oras.container.Container:
         """
@@ -498,27 +641,78 @@ class Registry:
     @decorator.ensure_container()
     @decorator.ensure_auth()
     def download_blob(
-        self, container: container_type, digest: str, outfile: str
+        self,
+        container: container_type,
+        digest: str,
+        outfile: str,
+        resume: bool = True,
+        segments: int = 1,
+        chunk_size: int = oras.defaults.default_download_chunksize,
     ) -> str:
         """
         Stream download a blob into an output file.
 
-        This function is a wrapper around get_blob.
+        This function is a wrapper around get_blob. The blob is written to a
+        "<outfile>.<digest prefix>.partial" file next to the output file, and only
+        moved into place once its digest is verified as it streams. If a partial
+        file of the same blob is left from an earlier attempt, we ask the registry
+        for the rest with a Range request.
+        A DigestMismatchError is raised if the content does not match. With a
+        blob cache, a cached blob is placed without touching the network and a
+        downloaded one is added to the cache.
 
         :param container:  parsed container URI
         :type container: oras.container.Container or str
+        :param digest: digest of the blob to download
+        :type digest: str
+        :param outfile: path to write the blob to
+        :type outfile: str
+        :param resume: continue from a partial file of an earlier attempt
+        :type resume: bool
+        :param segments: fetch a large blob as this many byte ranges at once,
+                         if the registry supports ranges.
+        :type segments: int
+        :param chunk_size: size of each chunk read from the response
+        :type chunk_size: int
         """
         try:
             # Ensure output directory exists first
             outdir = os.path.dirname(outfile)
             if outdir and not os.path.exists(outdir):
                 oras.utils.mkdir_p(outdir)
-            with self.get_blob(container, digest, stream=True) as r:
-                r.raise_for_status()
-                with open(outfile, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
+
+            # The cache only saves a download, a failure to use it is not fatal
+            if self.blob_cache:
+                try:
+                    if self.blob_cache.materialize(digest, outfile):
+                        logger.debug(f"Found {digest} in the blob cache.")
+                        return outfile
+                except OSError as e:
+                    logger.debug(f"Cannot place {digest} from the blob cache: {e}")
+
+            algorithm, expected = digest.split(":", 1)
+            # Named after the blob, so a partial of another one is never resumed
+            partial = f"{outfile}.{expected[:12]}.partial"
+            if segments > 1 and self._download_segments(
+                container, digest, partial, segments, chunk_size
+            ):
+                actual = oras.utils.get_file_digest(partial, algorithm)[1]
+            else:
+                actual = self._download_stream(
+                    container, digest, partial, algorithm, resume, chunk_size
+                )
+
+            if actual != expected:
+                os.remove(partial)
+                raise oras.utils.DigestMismatchError(
+                    outfile, digest, f"{algorithm}:{actual}"
+                )
+            os.replace(partial, outfile)
+            if self.blob_cache:
+                try:
+                    self.blob_cache.add(digest, outfile)
+                except OSError as e:
+                    logger.debug(f"Cannot add {digest} to the blob cache: {e}")
 
         # Allow an empty layer to fail and return /dev/null
         except Exception as e:
@@ -527,6 +721,152 @@ class Registry:
             raise e
         return outfile
 
+    def _download_stream(
+        self,
+        container: container_type,
+        digest: str,
+        partial: str,
+        algorithm: str = "sha256",
+        resume: bool = True,
+        chunk_size: int = oras.defaults.default_download_chunksize,
+    ) -> str:
+        """
+        Stream a blob into a partial file, returning the hex digest of the file.
+
+        :param container:  parsed container URI
+        :type container: oras.container.Container
+        :param digest: digest of the blob to download
+        :type digest: str
+        :param partial: path of the partial file to write
+        :type partial: str
+        :param algorithm: the digest algorithm to use
+        :type algorithm: str
+        :param resume: continue from an existing partial file
+        :type resume: bool
+        :param chunk_size: size of each chunk read from the response
+        :type chunk_size: int
+        """
+        hasher = hashlib.new(algorithm)
+        offset = 0
+        if resume and os.path.exists(partial):
+            offset = oras.utils.update_file_hash(hasher, partial)
+
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+        with self.get_blob(container, digest, stream=True, headers=headers) as r:
+            # The registry may not support ranges, or the partial is stale
+            if offset and r.status_code != 206:
+                logger.debug(f"Cannot resume {digest}, downloading it again.")
+                os.remove(partial)
+                return self._download_stream(
+                    container, digest, partial, algorithm, False, chunk_size
+                )
+            r.raise_for_status()
+            with open(partial, "ab" if offset else "wb") as f:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        hasher.update(chunk)
+                        f.write(chunk)
+        return hasher.hexdigest()
+
+    def _download_segments(
+        self,
+        container: container_type,
+        digest: str,
+        partial: str,
+        segments: int,
+        chunk_size: int = oras.defaults.default_download_chunksize,
+    ) -> bool:
+        """
+        Download a blob as concurrent byte ranges into a preallocated file.
+
+        Returns False, without downloading, if the registry doesn't support
+        ranges or the blob is too small to split.
+
+        :param container:  parsed container URI
+        :type container: oras.container.Container
+        :param digest: digest of the blob to download
+        :type digest: str
+        :param partial: path of the partial file to write
+        :type partial: str
+        :param segments: maximum number of byte ranges to fetch at once
+        :type segments: int
+        :param chunk_size: size of each chunk read from the responses
+        :type chunk_size: int
+        """
+        if not hasattr(os, "pwrite"):
+            return False
+
+        # Ask for the first byte, a 206 response tells us ranges work and the size
+        headers = {"Range": "bytes=0-0"}
+        with self.get_blob(container, digest, stream=True, headers=headers) as r:
+            match = re.match(r"bytes 0-0/(\d+)", r.headers.get("Content-Range", ""))
+        if r.status_code != 206 or not match:
+            return False
+        size = int(match.group(1))
+        segments = min(segments, size // oras.defaults.default_segment_min_size)
+        if segments <= 1:
+            return False
+
+        step = -(-size // segments)
+        fd = os.open(partial, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            ranges = [
+                functools.partial(
+                    self._download_segment,
+                    container=container,
+                    digest=digest,
+                    fd=fd,
+                    start=start,
+                    end=min(start + step, size) - 1,
+                    chunk_size=chunk_size,
+                )
+                for start in range(0, size, step)
+            ]
+            self._run_concurrently(ranges, segments)
+        finally:
+            os.close(fd)
+        return True
+
+    def _download_segment(
+        self,
+        container: container_type,
+        digest: str,
+        fd: int,
+        start: int,
+        end: int,
+        chunk_size: int = oras.defaults.default_download_chunksize,
+    ):
+        """
+        Download one byte range of a blob and write it at its offset.
+
+        :param container:  parsed container URI
+        :type container: oras.container.Container
+        :param digest: digest of the blob to download
+        :type digest: str
+        :param fd: file descriptor of the preallocated file
+        :type fd: int
+        :param start: first byte of the range
+        :type start: int
+        :param end: last byte of the range (inclusive)
+        :type end: int
+        :param chunk_size: size of each chunk read from the response
+        :type chunk_size: int
+        """
+        headers = {"Range": f"bytes={start}-{end}"}
+        with self.get_blob(container, digest, stream=True, headers=headers) as r:
+            if r.status_code != 206:
+                raise ValueError(
+                    f"Expected partial content for {digest}, got {r.status_code}"
+                )
+            offset = start
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    os.pwrite(fd, chunk, offset)  # type: ignore
+                    offset += len(chunk)
+        if offset != end + 1:
+            raise ValueError(f"Incomplete range {start}-{end} for {digest}")
+
     @decorator.ensure_container(1)
     @decorator.ensure_auth(1)
     def put_upload(
@@ -565,11 +905,12 @@ class Registry:
         blob_url = oras.utils.append_url_params(
             session_url, {"digest": layer["digest"]}
         )
+        # Stream the file so memory use does not grow with the blob size
         with open(blob, "rb") as fd:
             response = self.do_request(
                 blob_url,
                 method="PUT",
-                data=fd.read(),
+                data=fd,
                 headers=headers,
             )
         return response
@@ -623,61 +964,187 @@ class Registry:
         container: oras.container.Container,
         layer: dict,
         chunk_size: int = oras.defaults.default_chunksize,
+        resumable: Union[bool, str] = False,
+        stream: Optional[BinaryIO] = None,
     ) -> requests.Response:
         """
         Upload via a chunked upload.
 
+        If a chunk fails, we ask the registry how much it has committed and
+        continue from there. With resumable, the session url and offset are
+        also saved to a state file so a later call can pick up where an
+        interrupted upload stopped.
+
         :param blob: path to blob to upload
         :type blob: str
         :param container:  parsed container URI
         :type container: oras.container.Container or str
-        :param layer: dict from oras.oci.NewLayer
+        :param layer: dict from oras.oci.NewLayer. If it has no digest, the
+                      size and digest are computed from the uploaded chunks
+                      and added to it, so the file is only read once.
         :type layer: dict
         :param chunk_size: chunk size in bytes
         :type chunk_size: int
+        :param resumable: save progress to resume later. Set to True for the
+                          default cache directory, or a path.
+        :type resumable: bool or str
+        :param stream: read the content from this stream instead of opening
+                       blob, e.g., an archive that is written as we read it.
+        :type stream: file-like object
         """
-        # Start an upload session
-        headers = {"Content-Type": "application/octet-stream", "Content-Length": "0"}
-        headers.update(self.headers)
+        if stream is not None and resumable:
+            raise ValueError("An upload from a stream cannot be resumable.")
+        hasher = None if "digest" in layer else hashlib.sha256()
+        state = None
+        if resumable:
+            cache_dir = resumable if isinstance(resumable, str) else None
+            state = oras.cache.UploadState(blob, container, cache_dir)
+
+        # Continue a saved session if the registry still knows about it
+        session_url, start = None, 0
+        saved = state.load() if state else None
+        if saved:
+            status = self._get_upload_status(
+                saved["session_url"], container, saved.get("offset", 0)
+            )
 
-        upload_url = f"{self.prefix}://{container.upload_blob_url()}"
-        r = self.do_request(upload_url, "POST", headers=headers)
+            # The registry cannot have more than the file, start over if it says so
+            if status and status[1] > os.path.getsize(blob):
+                logger.warning(
+                    f"Registry has {status[1]} bytes of {blob}, more than its size, "
+                    "starting a new upload."
+                )
+                status = None
+            if status:
+                session_url, start = status
+                logger.info(f"Resuming upload of {blob} at byte {start}")
 
-        # Location should be in the header
-        session_url = self._get_location(r, container)
+        # Otherwise start an upload session
         if not session_url:
-            raise ValueError(f"Issue retrieving session url: {r.json()}")
+            headers = {
+                "Content-Type": "application/octet-stream",
+                "Content-Length": "0",
+            }
+            headers.update(self.headers)
+
+            upload_url = f"{self.prefix}://{container.upload_blob_url()}"
+            r = self.do_request(upload_url, "POST", headers=headers)
+
+            # Location should be in the header
+            session_url = self._get_location(r, container)
+            if not session_url:
+                raise ValueError(f"Issue retrieving session url: {r.json()}")
 
         # Read the blob in chunks, for each do a patch
-        start = 0
-        with open(blob, "rb") as fd:
-            for chunk in oras.utils.read_in_chunks(fd, chunk_size=chunk_size):
-                end = start + len(chunk) - 1
-                content_range = "%s-%s" % (start, end)
-                headers = {
-                    "Content-Range": content_range,
-                    "Content-Length": str(len(chunk)),
-                    "Content-Type": "application/octet-stream",
-                }
-                headers.update(self.headers)
-
-                # Important to update with auth token if acquired
-                # TODO call to auth here
-                start = end + 1
-                self._check_200_response(
-                    r := self.do_request(
-                        session_url, "PATCH", data=chunk, headers=headers
-                    )
-                )
-                session_url = self._get_location(r, container)
-                if not session_url:
-                    raise ValueError(f"Issue retrieving session url: {r.json()}")
+        resumes = oras.defaults.default_upload_resumes
+        with open(blob, "rb") if stream is None else nullcontext(stream) as fd:
+            # The digest also covers what was uploaded before we resumed
+            remaining = start if hasher is not None else 0
+            while remaining:
+                chunk = fd.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise ValueError(f"{blob} was truncated during the upload.")
+                hasher.update(chunk)  # type: ignore
+                remaining -= len(chunk)
+            if start:
+                fd.seek(start)
+
+            while chunk := fd.read(chunk_size):
+                # A chunk is sent again from where the registry stopped
+                while chunk:
+                    end = start + len(chunk) - 1
+                    content_range = "%s-%s" % (start, end)
+                    headers = {
+                        "Content-Range": content_range,
+                        "Content-Length": str(len(chunk)),
+                        "Content-Type": "application/octet-stream",
+                    }
+                    headers.update(self.headers)
+
+                    try:
+                        self._check_200_response(
+                            r := self.do_request(
+                                session_url, "PATCH", data=chunk, headers=headers
+                            )
+                        )
+                    except Exception:
+                        status = None
+                        if resumes:
+                            status = self._get_upload_status(
+                                session_url, container, start
+                            )
+                        if not status or not start <= status[1] <= end + 1:
+                            raise
+                        resumes -= 1
+
+                        # Keep what the registry committed and send the rest again
+                        session_url, committed = status
+                        logger.info(f"Continuing upload of {blob} at byte {committed}")
+                        if hasher is not None:
+                            hasher.update(chunk[: committed - start])
+                        chunk = chunk[committed - start :]
+                        start = committed
+                        continue
+
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    chunk = b""
+                    start = end + 1
+                    session_url = self._get_location(r, container)
+                    if not session_url:
+                        raise ValueError(f"Issue retrieving session url: {r.json()}")
+                    if state:
+                        state.save(session_url, start)
+
+        # Finalize the layer with what we uploaded
+        if hasher is not None:
+            layer["size"] = start
+            layer["digest"] = "sha256:" + hasher.hexdigest()
+            jsonschema.validate(layer, schema=oras.schemas.layer)
 
         # Finally, issue a PUT request to close blob
         session_url = oras.utils.append_url_params(
             session_url, {"digest": layer["digest"]}
         )
-        return self.do_request(session_url, "PUT", headers=self.headers)
+        response = self.do_request(session_url, "PUT", headers=dict(self.headers))
+        if state and response.status_code in [200, 201, 202]:
+            state.clear()
+        return response
+
+    def _get_upload_status(
+        self,
+        session_url: str,
+        container: oras.container.Container,
+        committed: int = 0,
+    ) -> Optional[Tuple[str, int]]:
+        """
+        Ask the registry how much of an upload session it has committed.
+
+        Returns the (possibly updated) session url and the offset to continue
+        from, or None if the session is unknown or the status is unavailable.
+
+        :param session_url: the upload session url
+        :type session_url: str
+        :param container:  parsed container URI
+        :type container: oras.container.Container
+        :param committed: number of bytes we know the registry has
+        :type committed: int
+        """
+        try:
+            r = self.do_request(session_url, "GET", headers=dict(self.headers))
+        except Exception as e:
+            logger.debug(f"Cannot get upload status for {session_url}: {e}")
+            return None
+        if r.status_code not in [200, 202, 204]:
+            return None
+
+        # The Range header is inclusive, but registries also send "0-0" for an
+        # empty upload, so that is one byte only if we know it got one
+        offset = 0
+        match = re.search(r"(\d+)-(\d+)", r.headers.get("Range", ""))
+        if match and (int(match.group(2)) > 0 or committed > 0):
+            offset = int(match.group(2)) + 1
+        return self._get_location(r, container) or session_url, offset
 
     def _check_200_response(self, response: requests.Response):
         """
@@ -743,6 +1210,12 @@ class Registry:
         subject: Optional[str] = None,
         do_chunked: bool = False,
         chunk_size: int = oras.defaults.default_chunksize,
+        max_workers: int = 1,
+        digest_on_upload: bool = False,
+        resumable: Union[bool, str] = False,
+        compression_threads: int = 1,
+        compression: str = "gzip",
+        compression_level: Optional[int] = None,
     ) -> requests.Response:
         """
         Push a set of files to a target
@@ -767,7 +1240,41 @@ class Registry:
         :type chunk_size: int
         :param subject: optional subject reference
         :type subject: oras.oci.Subject
+        :param max_workers: number of layers to prepare and upload concurrently
+        :type max_workers: int
+        :param digest_on_upload: with do_chunked, compute each layer digest while
+                                 uploading instead of reading the file first. This
+                                 skips the check for blobs already in the registry,
+                                 and directories are archived as they upload, with
+                                 no temporary file.
+        :type digest_on_upload: bool
+        :param resumable: with do_chunked, save upload progress so an interrupted
+                          push can resume. True for the default cache directory,
+                          or a path. This does not apply to directories.
+        :type resumable: bool or str
+        :param compression_threads: number of threads to compress each directory
+                                    with. The archives are reproducible, but not
+                                    the same as with a single thread.
+        :type compression_threads: int
+        :param compression: compression of directories, gzip or zstd. zstd needs
+                            Python 3.14+ or zstandard (pip install oras[zstd]).
+                            Use none for a plain tar, or auto to compress with
+                            gzip only if a sample of the files compresses well.
+        :type compression: str
+        :param compression_level: compression level, 0 for a plain tar. By default
+                                  9 for gzip and 3 for zstd.
+        :type compression_level: int
         """
+        if compression_level == 0:
+            compression = "none"
+        if (
+            compression != "auto"
+            and compression not in oras.defaults.blob_dir_media_types
+        ):
+            raise ValueError(f"Unsupported compression {compression}")
+        if compression == "zstd":
+            oras.utils.compression.get_zstd()
+
         container = self.get_container(target)
         files = files or []
 
@@ -783,16 +1290,15 @@ class Registry:
 
         # A lookup of annotations we can add (to blobs or manifest)
         annotset = oras.oci.Annotations(annotation_file)
-        media_type = None
 
-        # Upload files as blobs
+        # Validate all blobs up front, before anything is uploaded
+        blobs = []
         for blob in files:
             # You can provide a blob + content type
             path_content: PathAndOptionalContent = oras.utils.split_path_and_content(
                 str(blob)
             )
             blob = path_content.path
-            media_type = path_content.content
 
             # Must exist
             if not os.path.exists(blob):
@@ -804,44 +1310,25 @@ class Registry:
                     raise ValueError(
                         f"Blob {blob} is not in the present working directory context."
                     )
-
-            # Save directory or blob name before compressing
-            blob_name = os.path.basename(blob)
-
-            # If it's a directory, we need to compress
-            cleanup_blob = False
-            if os.path.isdir(blob):
-                blob = oras.utils.make_targz(blob)
-                cleanup_blob = True
-
-            # Create a new layer from the blob
-            layer = oras.oci.NewLayer(blob, is_dir=cleanup_blob, media_type=media_type)
-            annotations = annotset.get_annotations(blob)
-
-            # Always strip blob_name of path separator
-            layer["annotations"] = {
-                oras.defaults.annotation_title: blob_name.strip(os.sep)
-            }
-            if annotations:
-                layer["annotations"].update(annotations)
-
-            # update the manifest with the new layer
-            manifest["layers"].append(layer)
-            logger.debug(f"Preparing layer {layer}")
-
-            # Upload the blob layer
-            response = self.upload_blob(
-                blob,
-                container,
-                layer,
-                do_chunked=do_chunked,
-                chunk_size=chunk_size,
+            blobs.append(
+                functools.partial(
+                    self._push_layer,
+                    blob=blob,
+                    media_type=path_content.content,
+                    container=container,
+                    annotset=annotset,
+                    do_chunked=do_chunked,
+                    chunk_size=chunk_size,
+                    digest_on_upload=do_chunked and digest_on_upload,
+                    resumable=resumable,
+                    compression_threads=compression_threads,
+                    compression=compression,
+                    compression_level=compression_level,
+                )
             )
-            self._check_200_response(response)
 
-            # Do we need to cleanup a temporary targz?
-            if cleanup_blob and os.path.exists(blob):
-                os.remove(blob)
+        # Upload files as blobs, the manifest keeps the original layer order
+        manifest["layers"] = self._run_concurrently(blobs, max_workers=max_workers)
 
         # Add annotations to the manifest, if provided
         manifest_annots = annotset.get_annotations("$manifest") or {}
@@ -861,7 +1348,9 @@ class Registry:
         config_annots = annotset.get_annotations("$config")
         if manifest_config:
             ref, media_type = self._parse_manifest_ref(manifest_config)
-            conf, config_file = oras.oci.ManifestConfig(ref, media_type)
+            conf, config_file = oras.oci.ManifestConfig(
+                ref, media_type, digest_cache=self.digest_cache
+            )
         else:
             conf, config_file = oras.oci.ManifestConfig()
 
@@ -889,6 +1378,119 @@ class Registry:
         print(f"Successfully pushed {container}")
         return response
 
+    def _push_layer(
+        self,
+        blob: str,
+        media_type: Optional[str],
+        container: oras.container.Container,
+        annotset: oras.oci.Annotations,
+        do_chunked: bool = False,
+        chunk_size: int = oras.defaults.default_chunksize,
+        digest_on_upload: bool = False,
+        resumable: Union[bool, str] = False,
+        compression_threads: int = 1,
+        compression: str = "gzip",
+        compression_level: Optional[int] = None,
+    ) -> dict:
+        """
+        Prepare a layer for a blob (compressing directories) and upload it.
+
+        :param blob: path to the file or directory to upload
+        :type blob: str
+        :param media_type: media type for the blob (optional)
+        :type media_type: str
+        :param container:  parsed container URI
+        :type container: oras.container.Container
+        :param annotset: annotations lookup for blobs
+        :type annotset: oras.oci.Annotations
+        :param do_chunked: if true do chunked blob upload
+        :type do_chunked: bool
+        :param chunk_size: chunk size in bytes
+        :type chunk_size: int
+        :param digest_on_upload: compute the digest during the (chunked) upload
+        :type digest_on_upload: bool
+        :param resumable: save chunked upload progress to resume later
+        :type resumable: bool or str
+        :param compression_threads: number of threads to compress a directory with
+        :type compression_threads: int
+        :param compression: compression of a directory, gzip, zstd, none or auto
+        :type compression: str
+        :param compression_level: compression level (optional)
+        :type compression_level: int
+        """
+        # Save directory or blob name before compressing
+        blob_name = os.path.basename(blob)
+
+        # With the digest computed on upload, a directory is archived as it
+        # uploads. Otherwise we need to compress it to a temporary file.
+        is_dir = os.path.isdir(blob)
+        stream_dir = is_dir and do_chunked and digest_on_upload
+        if is_dir and compression == "auto":
+            compressible = oras.utils.compression.is_compressible(blob)
+            compression = "gzip" if compressible else "none"
+            logger.debug(f"Using {compression} compression for {blob}")
+
+        cleanup_blob = False
+        if is_dir and not stream_dir:
+            blob = oras.utils.make_targz(
+                blob,
+                compression_threads=compression_threads,
+                compression=compression,
+                compression_level=compression_level,
+            )
+            cleanup_blob = True
+        if is_dir and not media_type:
+            media_type = oras.defaults.blob_dir_media_types[compression]
+
+        try:
+            # Create a new layer from the blob
+            # A temporary archive is new every time, so don't cache its digest
+            layer = oras.oci.NewLayer(
+                blob,
+                is_dir=is_dir,
+                media_type=media_type,
+                digest_cache=None if is_dir else self.digest_cache,
+                compute_digest=not digest_on_upload,
+            )
+
+            # Upload the blob layer, this finalizes a layer without a digest
+            if stream_dir:
+                with oras.utils.stream_targz(
+                    blob, compression_threads, compression, compression_level
+                ) as stream:
+                    response = self.chunked_upload(
+                        blob, container, layer, chunk_size=chunk_size, stream=stream
+                    )
+            else:
+                response = self.upload_blob(
+                    blob,
+                    container,
+                    layer,
+                    do_chunked=do_chunked,
+                    chunk_size=chunk_size,
+                    resumable=resumable,
+                )
+            self._check_200_response(response)
+            annotations = annotset.get_annotations(blob)
+
+            # Always strip blob_name of path separator
+            layer["annotations"] = {
+                oras.defaults.annotation_title: blob_name.strip(os.sep)
+            }
+
+            # A plain tar has the media type of a file, so mark it to unpack
+            if is_dir and compression == "none":
+                layer["annotations"][oras.defaults.annotation_unpack] = "true"
+            if annotations:
+                layer["annotations"].update(annotations)
+            logger.debug(f"Pushed layer {layer}")
+
+        # Do we need to cleanup a temporary targz?
+        finally:
+            if cleanup_blob and os.path.exists(blob):
+                os.remove(blob)
+        return layer
+
     def pull(
         self,
         target: str,
@@ -896,6 +1498,11 @@ class Registry:
         allowed_media_type: Optional[List] = None,
         overwrite: bool = True,
         outdir: Optional[str] = None,
+        max_workers: int = 1,
+        segments: int = 1,
+        chunk_size: int = oras.defaults.default_download_chunksize,
+        skip_unchanged: bool = False,
+        extract_workers: int = 1,
     ) -> List[str]:
         """
         Pull an artifact from a target
@@ -912,6 +1519,18 @@ class Registry:
         :type outdir: str
         :param target: target location to pull from
         :type target: str
+        :param max_workers: number of layers to download and extract concurrently
+        :type max_workers: int
+        :param segments: fetch each large blob as this many concurrent byte ranges
+        :type segments: int
+        :param chunk_size: size of each chunk read from the responses
+        :type chunk_size: int
+        :param skip_unchanged: do not download a file layer when the output file
+                               already has the layer size and digest.
+        :type skip_unchanged: bool
+        :param extract_workers: number of threads to write the files of each
+                                directory layer with
+        :type extract_workers: int
         """
         container = self.get_container(target)
 
@@ -925,39 +1544,216 @@ class Registry:
         outdir = outdir or oras.utils.get_tmpdir()
         overwrite = overwrite
 
-        files = []
-        for layer in manifest.get("layers", []):
-            filename = (layer.get("annotations") or {}).get(
-                oras.defaults.annotation_title
+        layers = [
+            functools.partial(
+                self._pull_layer,
+                container=container,
+                layer=layer,
+                outdir=outdir,
+                overwrite=overwrite,
+                segments=segments,
+                chunk_size=chunk_size,
+                skip_unchanged=skip_unchanged,
+                extract_workers=extract_workers,
+            )
+            for layer in manifest.get("layers", [])
+        ]
+        # Each layer worker may fetch its blob as segments at once
+        self._ensure_pool_size(max(max_workers, 1) * max(segments, 1))
+        files = self._run_concurrently(layers, max_workers)
+        return [outfile for outfile in files if outfile]
+
+    def _pull_layer(
+        self,
+        container: oras.container.Container,
+        layer: dict,
+        outdir: str,
+        overwrite: bool = True,
+        segments: int = 1,
+        chunk_size: int = oras.defaults.default_download_chunksize,
+        skip_unchanged: bool = False,
+        extract_workers: int = 1,
+    ) -> Optional[str]:
+        """
+        Download (and extract, for a directory) a single layer.
+
+        Returns the path pulled to, or None if it was skipped.
+
+        :param container:  parsed container URI
+        :type container: oras.container.Container
+        :param layer: layer from the manifest to pull
+        :type layer: dict
+        :param outdir: output directory path
+        :type outdir: str
+        :param overwrite: if output file exists, overwrite
+        :type overwrite: bool
+        :param segments: number of byte ranges to fetch a large blob with
+        :type segments: int
+        :param chunk_size: size of each chunk read from the response
+        :type chunk_size: int
+        :param skip_unchanged: keep an output file that matches the layer
+        :type skip_unchanged: bool
+        :param extract_workers: number of threads to write extracted files with
+        :type extract_workers: int
+        """
+        filename = (layer.get("annotations") or {}).get(oras.defaults.annotation_title)
+
+        # If we don't have a filename, default to digest. Hopefully does not happen
+        if not filename:
+            filename = layer["digest"]
+
+        # This raises an error if there is a malicious path
+        outfile = oras.utils.sanitize_path(outdir, os.path.join(outdir, filename))
+
+        if not overwrite and os.path.exists(outfile):
+            logger.warning(
+                f"{outfile} already exists and --keep-old-files set, will not overwrite."
             )
+            return None
+
+        if skip_unchanged and self._is_unchanged(outfile, layer):
+            logger.info(f"{outfile} is unchanged, skipping download.")
+            return outfile
+
+        # A directory will need to be uncompressed and moved
+        compression = self._get_dir_compression(layer)
+        if compression:
+            # The artifact will be extracted to the correct name
+            if segments > 1 or self.blob_cache:
+                targz = oras.utils.get_tmpfile(suffix=".tar")
+                try:
+                    self.download_blob(
+                        container,
+                        layer["digest"],
+                        targz,
+                        segments=segments,
+                        chunk_size=chunk_size,
+                    )
+                    oras.utils.extract_targz(
+                        targz,
+                        os.path.dirname(outfile),
+                        compression=compression,
+                        max_workers=extract_workers,
+                    )
+                finally:
+                    if os.path.exists(targz):
+                        os.remove(targz)
+            else:
+                self._extract_blob(
+                    container,
+                    layer["digest"],
+                    os.path.dirname(outfile),
+                    chunk_size,
+                    compression,
+                    extract_workers,
+                )
 
-            # If we don't have a filename, default to digest. Hopefully does not happen
-            if not filename:
-                filename = layer["digest"]
+        # Anything else just extracted directly
+        else:
+            self.download_blob(
+                container,
+                layer["digest"],
+                outfile,
+                segments=segments,
+                chunk_size=chunk_size,
+            )
+        logger.info(f"Successfully pulled {outfile}.")
+        return outfile
 
-            # This raises an error if there is a malicious path
-            outfile = oras.utils.sanitize_path(outdir, os.path.join(outdir, filename))
+    def _extract_blob(
+        self,
+        container: oras.container.Container,
+        digest: str,
+        outdir: str,
+        chunk_size: int = oras.defaults.default_download_chunksize,
+        compression: str = "gzip",
+        max_workers: int = 1,
+    ):
+        """
+        Extract a .tar.gz blob to a directory as it downloads.
 
-            if not overwrite and os.path.exists(outfile):
-                logger.warning(
-                    f"{outfile} already exists and --keep-old-files set, will not overwrite."
+        The response is piped into tarfile in stream mode, so the archive is
+        never written to disk. The files are extracted to a temporary directory
+        in outdir while the digest is computed, and only moved into place if it
+        matches. Otherwise a DigestMismatchError is raised and outdir is left as
+        it was.
+
+        :param container:  parsed container URI
+        :type container: oras.container.Container
+        :param digest: digest of the blob to extract
+        :type digest: str
+        :param outdir: directory to extract to
+        :type outdir: str
+        :param chunk_size: size of each chunk read from the response
+        :type chunk_size: int
+        :param compression: compression of the archive, gzip, zstd or none
+        :type compression: str
+        :param max_workers: number of threads to write extracted files with
+        :type max_workers: int
+        """
+        if not os.path.exists(outdir):
+            oras.utils.mkdir_p(outdir)
+        algorithm, expected = digest.split(":", 1)
+        with TemporaryDirectory(prefix=".oras-extract-", dir=outdir) as tmpdir:
+            with self.get_blob(container, digest, stream=True) as r:
+                r.raise_for_status()
+                reader = oras.utils.HashingReader(
+                    r.iter_content(chunk_size=chunk_size), algorithm
+                )
+                oras.utils.extract_targz_stream(
+                    reader, tmpdir, compression=compression, max_workers=max_workers
+                )
+                reader.drain()
+
+            actual = reader.hexdigest()
+            if actual != expected:
+                raise oras.utils.DigestMismatchError(
+                    outdir, digest, f"{algorithm}:{actual}"
                 )
+            oras.utils.move_tree(tmpdir, outdir)
+
+    def _get_dir_compression(self, layer: dict) -> Optional[str]:
+        """
+        Get the compression of a directory layer, or None for any other layer.
+
+        :param layer: layer from the manifest
+        :type layer: dict
+        """
+        annotations = layer.get("annotations") or {}
+        for compression, media_type in oras.defaults.blob_dir_media_types.items():
+            if layer.get("mediaType") != media_type:
                 continue
+            if compression == "none":
+                if annotations.get(oras.defaults.annotation_unpack) != "true":
+                    return None
+            return compression
+        return None
 
-            # A directory will need to be uncompressed and moved
-            if layer["mediaType"] == oras.defaults.default_blob_dir_media_type:
-                targz = oras.utils.get_tmpfile(suffix=".tar.gz")
-                self.download_blob(container, layer["digest"], targz)
+    def _is_unchanged(self, outfile: str, layer: dict) -> bool:
+        """
+        Determine if an existing output file already has a layer's content.
 
-                # The artifact will be extracted to the correct name
-                oras.utils.extract_targz(targz, os.path.dirname(outfile))
+        Only file layers are compared, since a directory layer is a tarball that
+        is extracted. The size is checked first, and the digest is taken from the
+        digest cache when we have one.
 
-            # Anything else just extracted directly
-            else:
-                self.download_blob(container, layer["digest"], outfile)
-            logger.info(f"Successfully pulled {outfile}.")
-            files.append(outfile)
-        return files
+        :param outfile: the path the layer would be pulled to
+        :type outfile: str
+        :param layer: layer from the manifest
+        :type layer: dict
+        """
+        if self._get_dir_compression(layer):
+            return False
+        if not os.path.isfile(outfile) or "size" not in layer:
+            return False
+        if os.path.getsize(outfile) != layer["size"]:
+            return False
+        algorithm, expected = layer["digest"].split(":", 1)
+        if self.digest_cache:
+            actual = self.digest_cache.get_file_digest(outfile, algorithm)[1]
+        else:
+            actual = oras.utils.get_file_digest(outfile, algorithm)[1]
+        return actual == expected
 
     @decorator.ensure_container()
     @decorator.ensure_auth()
@@ -991,7 +1787,7 @@ class Registry:
         self,
         url: str,
         method: str = "GET",
-        data: Optional[Union[dict, bytes]] = None,
+        data: Optional[Union[dict, bytes, BinaryIO]] = None,
         headers: Optional[dict] = None,
         json: Optional[dict] = None,
         stream: bool = False,
@@ -1003,8 +1799,8 @@ class Registry:
         :type url: str
         :param method: the method to use (GET, DELETE, POST, PUT, PATCH)
         :type method: str
-        :param data: data for requests
-        :type data: dict or bytes
+        :param data: data for requests, a file object is streamed
+        :type data: dict, bytes or file object
         :param headers: headers for the request
         :type headers: dict
         :param json: json data for requests
@@ -1012,12 +1808,17 @@ class Registry:
         :param stream: stream the responses
         :type stream: bool
         """
-        if headers is None:
-            headers = {}
+        # Our own copy, the auth header is per request and the caller's dict
+        # may be shared with other threads
+        headers = dict(headers or {})
+
+        # A streamed body has to be rewound if we send the request again
+        offset = data.tell() if hasattr(data, "seek") else None  # type: ignore
 
-        # Make the request and return to calling function, but attempt to use auth token if previously obtained
-        if isinstance(self.auth, oras.auth.TokenAuth) and self.auth.token is not None:
-            headers.update(self.auth.get_auth_header())
+        # Make the request and return to calling function, but attempt to use auth token
+        # for the scope of the request if we know how to get it, or the last one
+        if isinstance(self.auth, oras.auth.TokenAuth):
+            headers.update(self.auth.get_request_auth_header(url, method))
         response = self.session.request(
             method,
             url,
@@ -1036,6 +1837,8 @@ class Registry:
         headers, changed = self.auth.authenticate_request(response, headers)
         if not changed:
             raise ValueError("Cannot respond to request for authentication.")
+        if offset is not None:
+            data.seek(offset)  # type: ignore
         response = self.session.request(
             method,
             url,
@@ -1051,6 +1854,8 @@ class Registry:
             headers, changed = self.auth.authenticate_request(
                 response, headers, refresh=True
             )
+            if offset is not None:
+                data.seek(offset)  # type: ignore
             response = self.session.request(
                 method,
                 url,
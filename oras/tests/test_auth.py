@@ -0,0 +1,327 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright The ORAS Authors."
+__license__ = "Apache-2.0"
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import oras.auth
+import oras.auth.utils as auth_utils
+import oras.cache
+
+
+class TokenSession:
+    """
+    A stand in for requests.Session that answers token requests.
+    """
+
+    def __init__(self, expires_in=300, name="token"):
+        self.expires_in = expires_in
+        self.name = name
+        self.scopes = []
+        self.fail = False
+        self.delay = 0
+
+    def _token(self, params):
+        time.sleep(self.delay)
+        response = requests.Response()
+        if self.fail:
+            response.status_code = 503
+            return response
+        self.scopes.append(params.get("scope"))
+        response.status_code = 200
+        content = {"token": f"{self.name}-{len(self.scopes)}"}
+        if self.expires_in:
+            content["expires_in"] = self.expires_in
+        response._content = json.dumps(content).encode()
+        return response
+
+    def get(self, url, headers=None, params=None, verify=True):
+        return self._token(params)
+
+    def request(self, method, url, params=None, verify=True):
+        return self._token(params)
+
+
+def challenge(scope, url="https://registry.example.com/v2/a/manifests/latest"):
+    """
+    A 401 response asking for a token with a scope.
+    """
+    response = requests.Response()
+    response.status_code = 401
+    response.url = url
+    response.headers["Www-Authenticate"] = (
+        f'Bearer realm="https://auth.example.com/token",service="registry",'
+        f'scope="{scope}"'
+    )
+    return response
+
+
+def headers_for(token):
+    """
+    The headers that send a token.
+    """
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_token_cache_by_scope():
+    print("Testing tokens are kept by scope")
+    auth = oras.auth.get_auth_backend(session=TokenSession())
+    pull_a = challenge("repository:a:pull")
+    pull_b = challenge("repository:b:pull")
+    push_a = challenge("repository:a:pull,push")
+
+    headers, changed = auth.authenticate_request(pull_a, {})
+    assert changed and headers["Authorization"] == "Bearer token-1"
+    headers, changed = auth.authenticate_request(pull_b, {})
+    assert changed and headers["Authorization"] == "Bearer token-2"
+    headers, changed = auth.authenticate_request(push_a, {})
+    assert changed and headers["Authorization"] == "Bearer token-3"
+
+    # Going back to a scope reuses its token
+    headers, _ = auth.authenticate_request(pull_a, {})
+    assert headers["Authorization"] == "Bearer token-1"
+    headers, _ = auth.authenticate_request(push_a, {})
+    assert headers["Authorization"] == "Bearer token-3"
+    assert auth.session.scopes == [
+        "repository:a:pull",
+        "repository:b:pull",
+        "repository:a:pull,push",
+    ]
+
+    # A refresh asks for a new one
+    headers, _ = auth.authenticate_request(pull_a, {}, refresh=True)
+    assert headers["Authorization"] == "Bearer token-4"
+
+    # As does logging out
+    auth.logout("registry.example.com")
+    headers, _ = auth.authenticate_request(pull_b, {})
+    assert headers["Authorization"] == "Bearer token-5"
+
+
+def test_token_cache_expiry(monkeypatch):
+    print("Testing tokens are not used after they expire")
+    auth = oras.auth.get_auth_backend(session=TokenSession(expires_in=None))
+    pull = challenge("repository:a:pull")
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    headers, _ = auth.authenticate_request(pull, {})
+    assert headers["Authorization"] == "Bearer token-1"
+
+    # Without expires_in, a token lasts 60 seconds, replaced 15 seconds early
+    monkeypatch.setattr(time, "time", lambda: now + 44)
+    headers, _ = auth.authenticate_request(pull, {})
+    assert headers["Authorization"] == "Bearer token-1"
+    monkeypatch.setattr(time, "time", lambda: now + 45)
+    headers, _ = auth.authenticate_request(pull, {})
+    assert headers["Authorization"] == "Bearer token-2"
+
+
+def test_token_refresh_ahead(monkeypatch):
+    print("Testing tokens are replaced before they expire")
+    auth = oras.auth.get_auth_backend(session=TokenSession())
+    url = "https://registry.example.com/v2/a/blobs/uploads/1234"
+    auth.authenticate_request(challenge("repository:a:pull,push"), {})
+
+    # A long upload gets a new token 30 seconds before the old one expires
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 269)
+    assert auth.get_request_auth_header(url, "PATCH") == headers_for("token-1")
+    monkeypatch.setattr(time, "time", lambda: now + 271)
+    assert auth.get_request_auth_header(url, "PATCH") == headers_for("token-2")
+
+    # If we cannot get one, the old token is used while it lasts
+    auth.session.fail = True
+    monkeypatch.setattr(time, "time", lambda: now + 271 + 299)
+    assert auth.get_request_auth_header(url, "PATCH") == headers_for("token-2")
+    auth.session.fail = False
+    assert auth.get_request_auth_header(url, "PATCH") == headers_for("token-3")
+
+
+def test_get_scope():
+    print("Testing the scope of a request")
+    url = "https://registry.example.com/v2/org/repo/blobs/uploads/1234"
+    assert auth_utils.get_scope(url, "POST") == "repository:org/repo:pull,push"
+    assert auth_utils.get_scope(url, "get") == "repository:org/repo:pull"
+    assert auth_utils.get_scope(url, "DELETE") is None
+    assert auth_utils.get_scope("https://registry.example.com/v2/", "GET") is None
+
+    # The repository is found from the end of the path
+    base = "https://registry.example.com/v2"
+    for path, method, scope in [
+        ("/org/blobs/blobs/sha256:1234", "HEAD", "repository:org/blobs:pull"),
+        ("/org/blobs/blobs/uploads/", "POST", "repository:org/blobs:pull,push"),
+        ("/org/blobs/blobs/uploads/1234", "PATCH", "repository:org/blobs:pull,push"),
+        ("/manifests/manifests/latest", "GET", "repository:manifests:pull"),
+        ("/a/manifests/b/tags/list?n=10", "GET", "repository:a/manifests/b:pull"),
+        ("/a/referrers/sha256:1234", "GET", "repository:a:pull"),
+    ]:
+        assert auth_utils.get_scope(base + path, method) == scope
+    assert (
+        auth_utils.normalize_scope("repository:b:push,pull repository:a:pull")
+        == "repository:a:pull repository:b:pull,push"
+    )
+
+
+def test_token_before_request():
+    print("Testing tokens are fetched before the first request of a scope")
+    auth = oras.auth.get_auth_backend(session=TokenSession())
+    url = "https://registry.example.com/v2/b/blobs/sha256:1234"
+
+    # Until we know the challenge of the registry there is nothing to send
+    assert auth.get_request_auth_header(url, "HEAD") == {}
+    auth.authenticate_request(challenge("repository:a:pull"), {})
+
+    headers = auth.get_request_auth_header(url, "HEAD")
+    assert headers["Authorization"] == "Bearer token-2"
+    headers = auth.get_request_auth_header(url, "PUT")
+    assert headers["Authorization"] == "Bearer token-3"
+    assert auth.get_request_auth_header(url, "GET") == headers_for("token-2")
+    assert auth.session.scopes[1:] == ["repository:b:pull", "repository:b:pull,push"]
+
+    # The registry may order actions differently, which is the same token
+    headers, _ = auth.authenticate_request(challenge("repository:b:push,pull"), {})
+    assert headers == headers_for("token-3")
+
+    # A token the registry refused is not sent again
+    headers, _ = auth.authenticate_request(
+        challenge("repository:b:pull"), headers_for("token-2")
+    )
+    assert headers == headers_for("token-4")
+
+    # Other registries and DELETE are left to their challenge
+    assert auth.get_request_auth_header(url, "DELETE") == {}
+    other = "https://other.example.com/v2/b/blobs/sha256:1234"
+    assert auth.get_request_auth_header(other) == {}
+    assert len(auth.session.scopes) == 4
+
+
+def test_token_set_by_user(tmp_path):
+    print("Testing a token set by the user is kept")
+    auth = oras.auth.get_auth_backend(session=TokenSession())
+    auth.set_token_auth("pat")
+    url = "https://registry.example.com/v2/b/blobs/sha256:1234"
+    assert auth.get_request_auth_header(url) == headers_for("pat")
+
+    # It is sent until the registry refuses it
+    headers, _ = auth.authenticate_request(challenge("repository:a:pull"), {})
+    assert headers == headers_for("pat")
+    headers, _ = auth.authenticate_request(
+        challenge("repository:a:pull"), headers_for("pat")
+    )
+    assert headers == headers_for("token-1")
+
+    # A token from the registry does not replace it
+    assert auth.get_request_auth_header(url, "PUT") == headers_for("pat")
+    assert auth.get_auth_header() == headers_for("pat")
+    assert auth.session.scopes == ["repository:a:pull"]
+
+    # And it is the fallback if we cannot get one
+    auth.session.fail = True
+    headers, _ = auth.authenticate_request(
+        challenge("repository:b:pull"), headers_for("pat")
+    )
+    assert headers == headers_for("pat")
+
+    # Nor does a challenge remembered on disk
+    auth.token_cache = oras.cache.TokenCache(str(tmp_path))
+    auth.authenticate_request(challenge("repository:a:pull"), headers_for("pat"))
+    auth = oras.auth.get_auth_backend(session=TokenSession(name="other"))
+    auth.token_cache = oras.cache.TokenCache(str(tmp_path))
+    auth.set_token_auth("pat")
+    assert auth.get_request_auth_header(url) == headers_for("pat")
+    assert not auth.session.scopes
+
+
+def test_token_cache_on_disk(tmp_path):
+    print("Testing tokens are shared through the token cache")
+    pull = challenge("repository:a:pull")
+    backends = []
+    for name in ["first", "second"]:
+        auth = oras.auth.get_auth_backend(session=TokenSession(name=name))
+        auth.token_cache = oras.cache.TokenCache(str(tmp_path))
+        backends.append(auth)
+
+    headers, _ = backends[0].authenticate_request(pull, {})
+    headers, _ = backends[1].authenticate_request(pull, {})
+    assert headers == headers_for("first-1")
+    assert not backends[1].session.scopes
+
+    # As is where to get them, so a new process can skip the 401
+    auth = oras.auth.get_auth_backend(session=TokenSession(name="third"))
+    auth.token_cache = oras.cache.TokenCache(str(tmp_path))
+    url = "https://registry.example.com/v2/a/blobs/sha256:1234"
+    assert auth.get_request_auth_header(url) == headers_for("first-1")
+
+    # Other credentials do not get it
+    backends[1]._tokens = {}
+    backends[1].set_basic_auth("user", "pass")
+    headers, _ = backends[1].authenticate_request(pull, {})
+    assert headers == headers_for("second-1")
+
+    # Logging out forgets the tokens of our credentials only
+    backends[1].logout("registry.example.com")
+    key = backends[0]._token_key(
+        auth_utils.parse_auth_header(pull.headers["Www-Authenticate"])
+    )
+    assert backends[1].token_cache.get(key, backends[1]._credentials_digest()) is None
+    assert backends[0].token_cache.get(key, backends[0]._credentials_digest())
+
+
+def test_token_single_flight():
+    print("Testing threads share one token request")
+    auth = oras.auth.get_auth_backend(session=TokenSession())
+    auth.session.delay = 0.2
+    pull = challenge("repository:a:pull")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(lambda _: auth.authenticate_request(pull, {}), range(8))
+        )
+    assert all(headers == headers_for("token-1") for headers, _ in results)
+    assert len(auth.session.scopes) == 1
+
+    # Threads refused with the same token get a single new one
+    refused = headers_for("token-1")
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(
+                lambda _: auth.authenticate_request(pull, dict(refused)), range(8)
+            )
+        )
+    assert all(headers == headers_for("token-2") for headers, _ in results)
+
+    # As do threads starting on a new scope
+    url = "https://registry.example.com/v2/b/blobs/sha256:1234"
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(lambda _: auth.get_request_auth_header(url), range(8))
+        )
+    assert all(headers == headers_for("token-3") for headers in results)
+    assert len(auth.session.scopes) == 3
+
+
+def test_token_saved_while_reading_cache(tmp_path):
+    print("Testing a token saved by another thread is not replaced")
+    auth = oras.auth.get_auth_backend(session=TokenSession())
+    auth.token_cache = oras.cache.TokenCache(str(tmp_path))
+    pull = challenge("repository:a:pull")
+    auth.authenticate_request(pull, {})
+    h = auth_utils.parse_auth_header(pull.headers["Www-Authenticate"])
+    auth._tokens = {}
+
+    # Another thread gets a new token while we read the one on disk
+    get = auth.token_cache.get
+
+    def get_and_save(*args):
+        saved = get(*args)
+        auth._save_token(h, {"token": "newer"})
+        return saved
+
+    auth.token_cache.get = get_and_save
+    assert auth.get_cached_token(h) == "newer"
+    assert auth._tokens[auth._token_key(h)]["token"] == "newer"
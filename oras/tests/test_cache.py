@@ -0,0 +1,142 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright The ORAS Authors."
+__license__ = "Apache-2.0"
+
+import os
+import time
+
+import pytest
+
+import oras.cache
+import oras.utils as utils
+
+
+def test_digest_cache(tmp_path, monkeypatch):
+    print("Testing oras.cache.DigestCache")
+
+    blob = str(tmp_path / "blob.txt")
+    utils.write_file(blob, "hello!")
+
+    # Move the file out of the racy window so its digest can be cached
+    past = time.time() - 60
+    os.utime(blob, (past, past))
+
+    cache = oras.cache.DigestCache(str(tmp_path / "cache"))
+    expected = utils.get_file_digest(blob)
+    assert cache.get_file_digest(blob) == expected
+
+    # A hit must not read the file again
+    def fail(*args, **kwargs):
+        raise AssertionError("file was hashed again")
+
+    monkeypatch.setattr(utils, "get_file_digest", fail)
+    assert cache.get_file_digest(blob) == expected
+    monkeypatch.undo()
+
+    # Changing the file invalidates the entry
+    utils.write_file(blob, "goodbye!")
+    os.utime(blob, (past + 1, past + 1))
+    assert cache.get_file_digest(blob) == utils.get_file_digest(blob)
+    assert cache.get_file_digest(blob) != expected
+
+    # The cache is persistent
+    cache.close()
+    cache = oras.cache.DigestCache(str(tmp_path / "cache"))
+    monkeypatch.setattr(utils, "get_file_digest", fail)
+    assert cache.get_file_digest(blob)[0] == len("goodbye!")
+
+
+def test_digest_cache_eviction(tmp_path):
+    print("Testing oras.cache.DigestCache eviction")
+
+    cache = oras.cache.DigestCache(str(tmp_path / "cache"), max_entries=10)
+    past = time.time() - 60
+    for i in range(25):
+        blob = str(tmp_path / f"blob-{i}.txt")
+        utils.write_file(blob, f"content {i}")
+        os.utime(blob, (past, past))
+        cache.get_file_digest(blob)
+    count = cache._db.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+    assert count <= 10
+
+
+def test_blob_cache(tmp_path):
+    print("Testing oras.cache.BlobCache")
+
+    blob = str(tmp_path / "blob.txt")
+    utils.write_file(blob, "hello!")
+    digest = "sha256:" + utils.get_file_hash(blob)
+
+    cache = oras.cache.BlobCache(str(tmp_path / "cache"))
+    assert cache.get(digest) is None
+    assert not cache.materialize(digest, str(tmp_path / "out.txt"))
+
+    path = cache.add(digest, blob)
+    assert cache.get(digest) == path
+    assert utils.read_file(path) == "hello!"
+
+    outfile = str(tmp_path / "out.txt")
+    assert cache.materialize(digest, outfile)
+    assert utils.read_file(outfile) == "hello!"
+
+    # Without hardlinks, changing the output leaves the cache alone
+    utils.write_file(outfile, "changed")
+    assert utils.read_file(path) == "hello!"
+
+    for digest in ["sha256:../../etc", "sha256", "SHA256:abc"]:
+        with pytest.raises(ValueError):
+            cache.blob_path(digest)
+
+
+def test_blob_cache_eviction(tmp_path):
+    print("Testing oras.cache.BlobCache eviction")
+
+    cache = oras.cache.BlobCache(str(tmp_path / "cache"), max_size=100)
+    digests = []
+    for i in range(5):
+        blob = str(tmp_path / f"blob-{i}.txt")
+        utils.write_file(blob, str(i) * 40)
+        digest = "sha256:" + utils.get_file_hash(blob)
+        cache.add(digest, blob)
+        past = time.time() - 60 + i
+        os.utime(cache.blob_path(digest), (past, past))
+        digests.append(digest)
+
+    # The most recently used blobs are kept
+    cache.evict()
+    assert [cache.get(d) is not None for d in digests] == [
+        False,
+        False,
+        False,
+        True,
+        True,
+    ]
+
+
+def test_token_cache(tmp_path, monkeypatch):
+    print("Testing oras.cache.TokenCache")
+
+    cache = oras.cache.TokenCache(str(tmp_path))
+    assert os.stat(cache.path).st_mode & 0o777 == 0o600
+    key = ("https://auth.example.com/token", "registry", "repository:a:pull")
+    now = time.time()
+    cache.set(key, "alice", "token-1", now + 300)
+    cache.set(key, "bob", "token-2", now + 300)
+    cache.close()
+
+    # Another process sees the tokens of the same credentials only
+    cache = oras.cache.TokenCache(str(tmp_path))
+    assert cache.get(key, "alice") == ("token-1", now + 300)
+    assert cache.get(key, "bob") == ("token-2", now + 300)
+    assert cache.get(key, "eve") is None
+    assert cache.get(key[:2] + ("repository:b:pull",), "alice") is None
+
+    assert cache.get_challenge("registry.example.com") is None
+    cache.set_challenge("registry.example.com", key[0], key[1])
+    assert cache.get_challenge("registry.example.com") == key[:2]
+
+    cache.clear("bob")
+    assert cache.get(key, "bob") is None
+    monkeypatch.setattr(time, "time", lambda: now + 300)
+    assert cache.get(key, "alice") is None
+    cache.close()
@@ -2,13 +2,19 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright The ORAS Authors."
 __license__ = "Apache-2.0"
 
+import functools
+import hashlib
 import os
 import subprocess
+import threading
 from pathlib import Path
 
 import pytest
+import requests
 
+import oras.cache
 import oras.client
+import oras.decorator
 import oras.defaults
 import oras.oci
 import oras.provider
@@ -176,6 +182,640 @@ def test_chunked_push(tmp_path, registry, credentials, target):
         res = client.push(files=[tmp_path / "none"], target=target)
 
 
+@pytest.mark.with_auth(False)
+def test_concurrent_push(tmp_path, registry, credentials, target):
+    """
+    Test pushing several layers with a pool of workers
+    """
+    client = oras.client.OrasClient(hostname=registry, insecure=True)
+    names = [f"layer-{i}.txt" for i in range(8)]
+    with oras.utils.workdir(tmp_path):
+        for name in names:
+            oras.utils.write_file(name, f"content of {name}")
+        res = client.push(files=names, target=target, max_workers=4)
+        assert res.status_code in [200, 201]
+
+    manifest = client.get_manifest(target)
+    titles = [
+        layer["annotations"][oras.defaults.annotation_title]
+        for layer in manifest["layers"]
+    ]
+    assert titles == names
+
+
+@pytest.mark.with_auth(False)
+def test_concurrent_pull(tmp_path, registry, credentials, target, monkeypatch):
+    """
+    Test pulling several layers with a pool of workers
+    """
+    client = oras.client.OrasClient(hostname=registry, insecure=True)
+    names = [f"layer-{i}.txt" for i in range(8)]
+    upload_dir = tmp_path / "upload"
+    upload_dir.mkdir()
+    with oras.utils.workdir(upload_dir):
+        for name in names:
+            oras.utils.write_file(name, f"content of {name}")
+        res = client.push(files=names, target=target)
+        assert res.status_code in [200, 201]
+
+    outdir = tmp_path / "download"
+    files = client.pull(target, outdir=str(outdir), max_workers=4)
+    assert files == [str(outdir / name) for name in names]
+    for name in names:
+        assert oras.utils.read_file(str(outdir / name)) == f"content of {name}"
+
+    # The connection pool is sized once for the segments of every worker
+    client.pull(target, outdir=str(outdir), max_workers=4, segments=3)
+    assert client._pool_maxsize == 12
+    adapter = client.session.get_adapter(f"http://{registry}")
+    client._ensure_pool_size(3)
+    assert client.session.get_adapter(f"http://{registry}") is adapter
+
+    # A corrupt layer raises the same error as it does without workers
+    corrupt = client.get_manifest(target)["layers"][3]["digest"]
+    download_stream = client._download_stream
+
+    def corrupting(container, digest, *args, **kwargs):
+        actual = download_stream(container, digest, *args, **kwargs)
+        return "0" * len(actual) if digest == corrupt else actual
+
+    monkeypatch.setattr(client, "_download_stream", corrupting)
+    for max_workers in [1, 4]:
+        with pytest.raises(oras.utils.DigestMismatchError) as e:
+            client.pull(target, outdir=str(outdir), max_workers=max_workers)
+        assert e.value.expected == corrupt
+
+
+@pytest.mark.with_auth(False)
+def test_push_digest_on_upload(tmp_path, registry, credentials, target):
+    """
+    Test computing the layer digest while doing a chunked upload
+    """
+    client = oras.client.OrasClient(hostname=registry, insecure=True)
+    content = os.urandom(1024 * 10 + 7)
+    with oras.utils.workdir(tmp_path):
+        with open("blob.bin", "wb") as fd:
+            fd.write(content)
+        res = client.push(
+            files=["blob.bin"],
+            target=target,
+            do_chunked=True,
+            chunk_size=1024,
+            digest_on_upload=True,
+        )
+        assert res.status_code in [200, 201, 202]
+        expected = oras.oci.NewLayer("blob.bin")
+
+    layer = client.get_manifest(target)["layers"][0]
+    assert layer["size"] == expected["size"] == len(content)
+    assert layer["digest"] == expected["digest"]
+
+    files = client.pull(target, outdir=str(tmp_path / "download"))
+    assert oras.utils.get_file_hash(files[0]) == expected["digest"].split(":")[1]
+
+
+@pytest.mark.with_auth(False)
+def test_resumable_chunked_upload(tmp_path, registry, credentials, target):
+    """
+    Test continuing a chunked upload after failures
+    """
+    remote = oras.provider.Registry(hostname=registry, insecure=True)
+    container = remote.get_container(target)
+    blob = str(tmp_path / "blob.bin")
+    content = os.urandom(1024 * 8)
+    with open(blob, "wb") as fd:
+        fd.write(content)
+
+    do_request = remote.do_request
+    patches = []
+
+    def flaky(url, method="GET", **kwargs):
+        if method == "PATCH":
+            patches.append(kwargs["headers"]["Content-Range"])
+            # Fail the second chunk once, then lose the network on the fifth
+            if len(patches) == 2 or len(patches) >= 6:
+                raise ConnectionError("network is down")
+        return do_request(url, method, **kwargs)
+
+    remote.do_request = flaky
+    layer = {"mediaType": oras.defaults.default_blob_media_type}
+    state_dir = str(tmp_path / "state")
+    with pytest.raises(ConnectionError):
+        remote.chunked_upload(blob, container, {}, chunk_size=1024, resumable=state_dir)
+
+    # The failed second chunk was sent again after asking the registry
+    assert patches[1] == patches[2] == "1024-2047"
+
+    # A new call resumes after the four committed chunks
+    patches.clear()
+
+    def recording(url, method="GET", **kwargs):
+        if method == "PATCH":
+            patches.append(kwargs["headers"]["Content-Range"])
+        return do_request(url, method, **kwargs)
+
+    remote.do_request = recording
+    layer = {"mediaType": oras.defaults.default_blob_media_type}
+    response = remote.chunked_upload(
+        blob, container, layer, chunk_size=1024, resumable=state_dir
+    )
+    assert response.status_code == 201
+    assert patches == ["4096-5119", "5120-6143", "6144-7167", "7168-8191"]
+    assert layer["digest"] == oras.oci.NewLayer(blob)["digest"]
+    assert not os.listdir(os.path.join(state_dir, "uploads"))
+
+    # A registry that claims more than the file has gets a new upload
+    oras.cache.UploadState(blob, container, state_dir).save("http://gone", 0)
+    remote._get_upload_status = lambda url, *args: (url, len(content) + 1024)
+    patches.clear()
+    layer = {"mediaType": oras.defaults.default_blob_media_type}
+    response = remote.chunked_upload(
+        blob, container, layer, chunk_size=4096, resumable=state_dir
+    )
+    assert response.status_code == 201
+    assert patches == ["0-4095", "4096-8191"]
+    assert layer["digest"] == oras.oci.NewLayer(blob)["digest"]
+
+
+def test_get_upload_status(monkeypatch):
+    """
+    A "0-0" range is an empty upload unless we know a byte was committed.
+    """
+    remote = oras.provider.Registry(insecure=True)
+    container = remote.get_container("localhost/a:v1")
+    url = "http://localhost/v2/a/blobs/uploads/1234"
+    ranges = {}
+
+    def status(url, method="GET", **kwargs):
+        response = requests.Response()
+        response.status_code = 204
+        response.headers["Range"] = ranges["value"]
+        return response
+
+    monkeypatch.setattr(remote, "do_request", status)
+    for value, committed, offset in [
+        ("0-0", 0, 0),
+        ("0-0", 1, 1),
+        ("0-1023", 0, 1024),
+        ("0-1023", 1024, 1024),
+    ]:
+        ranges["value"] = value
+        assert remote._get_upload_status(url, container, committed) == (url, offset)
+
+
+@pytest.mark.with_auth(False)
+def test_resume_download_blob(tmp_path, registry, credentials, target):
+    """
+    Test resuming a download from a partial file, and digest verification
+    """
+    client = oras.client.OrasClient(hostname=registry, insecure=True)
+    content = os.urandom(1024 * 64)
+    with oras.utils.workdir(tmp_path):
+        with open("blob.bin", "wb") as fd:
+            fd.write(content)
+        res = client.push(files=["blob.bin"], target=target)
+        assert res.status_code in [200, 201]
+    digest = client.get_manifest(target)["layers"][0]["digest"]
+
+    # A partial download is completed with the rest of the blob
+    outfile = str(tmp_path / "download" / "blob.bin")
+    partial = f"{outfile}.{digest.split(':')[1][:12]}.partial"
+    os.makedirs(os.path.dirname(outfile))
+    with open(partial, "wb") as fd:
+        fd.write(content[:1000])
+    assert client.download_blob(target, digest, outfile) == outfile
+    assert not os.path.exists(partial)
+    with open(outfile, "rb") as fd:
+        assert fd.read() == content
+
+    # A corrupt partial download fails verification and is removed
+    os.remove(outfile)
+    with open(partial, "wb") as fd:
+        fd.write(b"x" * 1000)
+    with pytest.raises(oras.utils.DigestMismatchError):
+        client.download_blob(target, digest, outfile)
+    assert not os.path.exists(partial)
+    assert not os.path.exists(outfile)
+    assert client.download_blob(target, digest, outfile) == outfile
+
+    # A partial left by another blob of the same name (e.g., an older tag)
+    # does not get in the way
+    os.remove(outfile)
+    other = os.urandom(1024 * 64)
+    for stale in [
+        f"{outfile}.partial",
+        f"{outfile}.{hashlib.sha256(other).hexdigest()[:12]}.partial",
+    ]:
+        with open(stale, "wb") as fd:
+            fd.write(other[:1000])
+    assert client.download_blob(target, digest, outfile) == outfile
+    with open(outfile, "rb") as fd:
+        assert fd.read() == content
+
+
+@pytest.mark.with_auth(False)
+def test_segmented_download_blob(tmp_path, registry, credentials, target, monkeypatch):
+    """
+    Test downloading a blob as concurrent byte ranges
+    """
+    client = oras.client.OrasClient(hostname=registry, insecure=True)
+    content = os.urandom(1024 * 64 + 3)
+    with oras.utils.workdir(tmp_path):
+        with open("blob.bin", "wb") as fd:
+            fd.write(content)
+        res = client.push(files=["blob.bin"], target=target)
+        assert res.status_code in [200, 201]
+    digest = client.get_manifest(target)["layers"][0]["digest"]
+
+    ranges = []
+    download_segment = client._download_segment
+
+    def record(start, end, **kwargs):
+        ranges.append((start, end))
+        return download_segment(start=start, end=end, **kwargs)
+
+    monkeypatch.setattr(oras.defaults, "default_segment_min_size", 1024)
+    monkeypatch.setattr(client, "_download_segment", record)
+    outfile = str(tmp_path / "download" / "blob.bin")
+    assert client.download_blob(target, digest, outfile, segments=4) == outfile
+    with open(outfile, "rb") as fd:
+        assert fd.read() == content
+    assert len(ranges) == 4
+    assert sorted(ranges)[-1][1] == len(content) - 1
+
+
+@pytest.mark.with_auth(False)
+def test_pull_blob_cache(tmp_path, registry, credentials, target, monkeypatch):
+    """
+    Test a second pull is served from the blob cache without the network
+    """
+    client = oras.client.OrasClient(
+        hostname=registry, insecure=True, blob_cache=str(tmp_path / "cache")
+    )
+    content = os.urandom(1024 * 16)
+    with oras.utils.workdir(tmp_path):
+        with open("blob.bin", "wb") as fd:
+            fd.write(content)
+        res = client.push(files=["blob.bin"], target=target)
+        assert res.status_code in [200, 201]
+
+    files = client.pull(target, outdir=str(tmp_path / "first"))
+    assert len(files) == 1
+    digest = client.get_manifest(target)["layers"][0]["digest"]
+    assert client.blob_cache.get(digest)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("blob was downloaded again")
+
+    monkeypatch.setattr(client, "get_blob", fail)
+    files = client.pull(target, outdir=str(tmp_path / "second"))
+    with open(files[0], "rb") as fd:
+        assert fd.read() == content
+
+    # The cache can hardlink blobs into place where it cannot reflink them
+    client = oras.client.OrasClient(
+        hostname=registry,
+        insecure=True,
+        blob_cache=str(tmp_path / "cache"),
+        blob_cache_hardlink=True,
+    )
+    assert client.blob_cache.hardlink
+    monkeypatch.setattr(client, "get_blob", fail)
+    files = client.pull(target, outdir=str(tmp_path / "third"))
+    with open(files[0], "rb") as fd:
+        assert fd.read() == content
+    cached = client.blob_cache.get(digest)
+    assert os.path.samefile(files[0], cached) or os.stat(cached).st_nlink == 1
+
+    # A cache we cannot write to, or place from, does not fail the pull
+    def broken(*args, **kwargs):
+        raise PermissionError("read-only file system")
+
+    monkeypatch.setattr(oras.utils, "clone_file", broken)
+    for cache in ["other-cache", "cache"]:
+        client = oras.client.OrasClient(
+            hostname=registry, insecure=True, blob_cache=str(tmp_path / cache)
+        )
+        files = client.pull(target, outdir=str(tmp_path / f"{cache}-pull"))
+        with open(files[0], "rb") as fd:
+            assert fd.read() == content
+
+
+@pytest.mark.with_auth(False)
+def test_pull_skip_unchanged(tmp_path, registry, credentials, target, monkeypatch):
+    """
+    Test an incremental pull only downloads the layers that changed
+    """
+    client = oras.client.OrasClient(hostname=registry, insecure=True)
+    files = [f"file-{i}.txt" for i in range(5)]
+    with oras.utils.workdir(tmp_path):
+        for name in files:
+            oras.utils.write_file(name, f"content of {name}")
+        res = client.push(files=files, target=target)
+        assert res.status_code in [200, 201]
+
+    outdir = str(tmp_path / "out")
+    assert len(client.pull(target, outdir=outdir)) == 5
+    oras.utils.write_file(os.path.join(outdir, files[1]), "changed")
+    oras.utils.write_file(os.path.join(outdir, files[3]), "x" * 100)
+
+    downloaded = []
+    download_blob = client.download_blob
+
+    def record(container, digest, outfile, *args, **kwargs):
+        downloaded.append(os.path.basename(outfile))
+        return download_blob(container, digest, outfile, *args, **kwargs)
+
+    monkeypatch.setattr(client, "download_blob", record)
+    pulled = client.pull(target, outdir=outdir, skip_unchanged=True)
+    assert len(pulled) == 5
+    assert sorted(downloaded) == [files[1], files[3]]
+    for name in files:
+        assert oras.utils.read_file(os.path.join(outdir, name)) == f"content of {name}"
+
+
+@pytest.mark.with_auth(False)
+def test_pull_directory_stream(tmp_path, registry, credentials, target, monkeypatch):
+    """
+    Test a directory layer is extracted as it downloads, without a temp file
+    """
+    client = oras.client.OrasClient(hostname=registry, insecure=True)
+    upload_dir = tmp_path / "upload"
+    (upload_dir / "artifact" / "nested").mkdir(parents=True)
+    for i in range(5):
+        oras.utils.write_file(
+            str(upload_dir / "artifact" / "nested" / f"{i}.txt"), f"content {i}"
+        )
+    with oras.utils.workdir(upload_dir):
+        res = client.push(files=["artifact"], target=target)
+        assert res.status_code in [200, 201]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("a temporary file was used")
+
+    monkeypatch.setattr(oras.utils, "get_tmpfile", fail)
+    outdir = tmp_path / "download"
+    files = client.pull(target, outdir=str(outdir))
+    assert files == [str(outdir / "artifact")]
+    for i in range(5):
+        path = str(outdir / "artifact" / "nested" / f"{i}.txt")
+        assert oras.utils.read_file(path) == f"content {i}"
+
+    # The files can be written on several threads
+    outdir = tmp_path / "parallel"
+    files = client.pull(target, outdir=str(outdir), extract_workers=4)
+    for i in range(5):
+        path = str(outdir / "artifact" / "nested" / f"{i}.txt")
+        assert oras.utils.read_file(path) == f"content {i}"
+
+    # Pulling again replaces the files and keeps others in the directory
+    oras.utils.write_file(str(outdir / "artifact" / "nested" / "0.txt"), "old")
+    oras.utils.write_file(str(outdir / "artifact" / "other.txt"), "other")
+    client.pull(target, outdir=str(outdir))
+    path = str(outdir / "artifact" / "nested" / "0.txt")
+    assert oras.utils.read_file(path) == "content 0"
+    assert oras.utils.read_file(str(outdir / "artifact" / "other.txt")) == "other"
+
+    # A corrupt blob leaves the directory as it was
+    oras.utils.write_file(path, "old")
+    before = sorted(str(p) for p in outdir.rglob("*"))
+    monkeypatch.setattr(oras.utils.HashingReader, "hexdigest", lambda self: "0" * 64)
+    with pytest.raises(oras.utils.DigestMismatchError):
+        client.pull(target, outdir=str(outdir))
+    assert sorted(str(p) for p in outdir.rglob("*")) == before
+    assert oras.utils.read_file(path) == "old"
+
+
+@pytest.mark.with_auth(False)
+def test_push_directory_stream(tmp_path, registry, credentials, target, monkeypatch):
+    """
+    Test a directory is archived as it uploads, without a temporary file
+    """
+    client = oras.client.OrasClient(hostname=registry, insecure=True)
+    upload_dir = tmp_path / "upload"
+    (upload_dir / "artifact").mkdir(parents=True)
+    for i in range(5):
+        with open(upload_dir / "artifact" / f"{i}.bin", "wb") as fd:
+            fd.write(os.urandom(1024 * 8))
+    expected = oras.utils.get_file_hash(
+        oras.utils.make_targz(
+            str(upload_dir / "artifact"), str(tmp_path / "artifact.tar.gz")
+        )
+    )
+
+    def fail(*args, **kwargs):
+        raise AssertionError("a temporary archive was written")
+
+    monkeypatch.setattr(oras.utils, "make_targz", fail)
+    with oras.utils.workdir(upload_dir):
+        res = client.push(
+            files=["artifact"],
+            target=target,
+            do_chunked=True,
+            chunk_size=1024 * 4,
+            digest_on_upload=True,
+        )
+        assert res.status_code in [200, 201]
+
+    # The streamed archive is the same as the one written to disk
+    layer = client.get_manifest(target)["layers"][0]
+    assert layer["digest"] == f"sha256:{expected}"
+    assert layer["mediaType"] == oras.defaults.default_blob_dir_media_type
+
+    outdir = tmp_path / "download"
+    client.pull(target, outdir=str(outdir))
+    for i in range(5):
+        with open(outdir / "artifact" / f"{i}.bin", "rb") as fd:
+            with open(upload_dir / "artifact" / f"{i}.bin", "rb") as orig:
+                assert fd.read() == orig.read()
+
+
+@pytest.mark.with_auth(False)
+def test_push_compression_threads(tmp_path, registry, credentials, target):
+    """
+    Test pushing a directory compressed on several threads
+    """
+    client = oras.client.OrasClient(hostname=registry, insecure=True)
+    upload_dir = tmp_path / "upload"
+    (upload_dir / "artifact").mkdir(parents=True)
+    content = b"oras " * 100000 + os.urandom(1024 * 64)
+    with open(upload_dir / "artifact" / "data.bin", "wb") as fd:
+        fd.write(content)
+    expected = oras.utils.get_file_hash(
+        oras.utils.make_targz(
+            str(upload_dir / "artifact"), str(tmp_path / "artifact.tar.gz"), 4
+        )
+    )
+
+    with oras.utils.workdir(upload_dir):
+        res = client.push(files=["artifact"], target=target, compression_threads=4)
+        assert res.status_code in [200, 201]
+    assert client.get_manifest(target)["layers"][0]["digest"] == f"sha256:{expected}"
+
+    outdir = tmp_path / "download"
+    client.pull(target, outdir=str(outdir))
+    with open(outdir / "artifact" / "data.bin", "rb") as fd:
+        assert fd.read() == content
+
+
+@pytest.mark.with_auth(False)
+@pytest.mark.parametrize("digest_on_upload", [False, True])
+def test_push_pull_zstd(tmp_path, registry, credentials, target, digest_on_upload):
+    """
+    Test a zstd compressed directory layer is pushed and extracted on pull
+    """
+    try:
+        oras.utils.compression.get_zstd()
+    except ImportError:
+        pytest.skip("zstd is not available")
+    client = oras.client.OrasClient(hostname=registry, insecure=True)
+    upload_dir = tmp_path / "upload"
+    (upload_dir / "artifact").mkdir(parents=True)
+    content = b"oras " * 100000 + os.urandom(1024)
+    with open(upload_dir / "artifact" / "data.bin", "wb") as fd:
+        fd.write(content)
+
+    with oras.utils.workdir(upload_dir):
+        res = client.push(
+            files=["artifact"],
+            target=target,
+            compression="zstd",
+            do_chunked=digest_on_upload,
+            digest_on_upload=digest_on_upload,
+        )
+        assert res.status_code in [200, 201]
+    layer = client.get_manifest(target)["layers"][0]
+    assert layer["mediaType"] == oras.defaults.default_blob_dir_zstd_media_type
+
+    for segments in [1, 2]:
+        outdir = tmp_path / f"download-{segments}"
+        files = client.pull(target, outdir=str(outdir), segments=segments)
+        assert files == [str(outdir / "artifact")]
+        with open(outdir / "artifact" / "data.bin", "rb") as fd:
+            assert fd.read() == content
+
+    with pytest.raises(ValueError):
+        client.push(files=["artifact"], target=target, compression="bz2")
+
+
+@pytest.mark.with_auth(False)
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"compression": "auto"},
+        {"compression_level": 0},
+        {"compression_level": 0, "do_chunked": True, "digest_on_upload": True},
+    ],
+)
+def test_push_pull_uncompressed(tmp_path, registry, credentials, target, options):
+    """
+    Test a directory of incompressible data is pushed as a plain tar
+    """
+    client = oras.client.OrasClient(hostname=registry, insecure=True)
+    upload_dir = tmp_path / "upload"
+    (upload_dir / "artifact").mkdir(parents=True)
+    content = os.urandom(1024 * 128)
+    with open(upload_dir / "artifact" / "data.parquet", "wb") as fd:
+        fd.write(content)
+
+    with oras.utils.workdir(upload_dir):
+        res = client.push(files=["artifact"], target=target, **options)
+        assert res.status_code in [200, 201]
+    layer = client.get_manifest(target)["layers"][0]
+    assert layer["mediaType"] == oras.defaults.default_blob_media_type
+    assert layer["annotations"][oras.defaults.annotation_unpack] == "true"
+    assert layer["size"] > len(content)
+
+    outdir = tmp_path / "download"
+    files = client.pull(target, outdir=str(outdir))
+    assert files == [str(outdir / "artifact")]
+    with open(outdir / "artifact" / "data.parquet", "rb") as fd:
+        assert fd.read() == content
+
+
+def test_run_concurrently():
+    """
+    Results keep their order, a single failure keeps its type and several are
+    aggregated into one error.
+    """
+    remote = oras.provider.Registry(insecure=True)
+    calls = [functools.partial(lambda x: x * 2, x=i) for i in range(20)]
+    assert remote._run_concurrently(calls, max_workers=4) == [i * 2 for i in range(20)]
+
+    def fail(x, fails, barrier):
+        barrier.wait(timeout=5)
+        if x in fails:
+            raise FileNotFoundError(f"missing {x}")
+        return x
+
+    # The failures are running together, so both are reported
+    barrier = threading.Barrier(4)
+    with pytest.raises(oras.provider.ConcurrentOperationsError) as e:
+        calls = [functools.partial(fail, i, {1, 3}, barrier) for i in range(4)]
+        remote._run_concurrently(calls, max_workers=4)
+    assert "2 of 4 operations failed" in str(e.value)
+    assert [type(error) for error in e.value.errors] == [FileNotFoundError] * 2
+    assert isinstance(e.value.__cause__, FileNotFoundError)
+
+    barrier = threading.Barrier(4)
+    with pytest.raises(FileNotFoundError, match="missing 2"):
+        calls = [functools.partial(fail, i, {2}, barrier) for i in range(4)]
+        remote._run_concurrently(calls, max_workers=4)
+
+
+def test_do_request_keeps_headers(monkeypatch):
+    """
+    The per request auth header is not written into the headers passed in.
+    """
+    remote = oras.provider.Registry(insecure=True)
+    remote.set_header("User-Agent", "oras-py")
+    sent = []
+
+    def request(method, url, headers=None, **kwargs):
+        sent.append(headers)
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+    monkeypatch.setattr(remote.session, "request", request)
+    monkeypatch.setattr(
+        remote.auth,
+        "get_request_auth_header",
+        lambda url, method: {"Authorization": "Bearer token"},
+    )
+    remote.do_request("http://localhost/v2/a/manifests/v1", headers=remote.headers)
+    assert sent[0] == {"User-Agent": "oras-py", "Authorization": "Bearer token"}
+    assert remote.headers == {"User-Agent": "oras-py"}
+
+
+def test_do_request_retry_rewinds_body(tmp_path, monkeypatch):
+    """
+    A retry after part of a streamed body was sent sends all of it again.
+    """
+    remote = oras.provider.Registry(insecure=True)
+    blob = tmp_path / "blob.bin"
+    content = os.urandom(4096)
+    blob.write_bytes(content)
+    bodies = []
+
+    def request(method, url, data=None, **kwargs):
+        if not bodies:
+            bodies.append(data.read(1000))
+            raise requests.exceptions.ConnectionError("connection reset")
+        bodies.append(data.read())
+        response = requests.Response()
+        response.status_code = 201
+        return response
+
+    monkeypatch.setattr(remote.session, "request", request)
+    monkeypatch.setattr(oras.decorator.time, "sleep", lambda seconds: None)
+    with open(blob, "rb") as fd:
+        fd.seek(96)
+        response = remote.do_request("http://localhost/v2/a/blobs/1", "PUT", data=fd)
+    assert response.status_code == 201
+    assert bodies == [content[96:1096], content[96:]]
+
+
 def test_parse_manifest(registry):
     """
     Test parse manifest function.
@@ -2,14 +2,28 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright The ORAS Authors."
 __license__ = "Apache-2.0"
 
+import gzip
+import hashlib
+import io
 import json
 import os
 import pathlib
 import shutil
+import tarfile
 
 import pytest
 
+import oras.defaults
 import oras.utils as utils
+from oras.utils.compression import ParallelGzipFile, get_zstd, is_compressible
+
+
+def has_zstd():
+    try:
+        get_zstd()
+    except ImportError:
+        return False
+    return True
 
 
 def test_write_read_files(tmp_path):
@@ -71,6 +85,30 @@ def test_copyfile(tmp_path):
     assert os.path.exists(dest)
 
 
+def test_move_tree(tmp_path):
+    print("Testing utils.move_tree")
+    source, dest = tmp_path / "source", tmp_path / "dest"
+    (source / "a" / "b").mkdir(parents=True)
+    (dest / "a").mkdir(parents=True)
+    (dest / "c").mkdir()
+    utils.write_file(str(source / "a" / "b" / "new.txt"), "new")
+    utils.write_file(str(source / "a" / "same.txt"), "new")
+    utils.write_file(str(source / "c"), "file")
+    utils.write_file(str(dest / "a" / "same.txt"), "old")
+    utils.write_file(str(dest / "a" / "kept.txt"), "kept")
+
+    # A directory the archive made read-only is still merged
+    os.chmod(source / "a", 0o555)
+    utils.move_tree(str(source), str(dest))
+    assert not os.listdir(source / "a")
+    assert utils.read_file(str(dest / "a" / "b" / "new.txt")) == "new"
+    assert utils.read_file(str(dest / "a" / "same.txt")) == "new"
+    assert utils.read_file(str(dest / "a" / "kept.txt")) == "kept"
+    assert utils.read_file(str(dest / "c")) == "file"
+    assert os.stat(dest / "a").st_mode & 0o777 == 0o555
+    os.chmod(dest / "a", 0o755)
+
+
 def test_get_tmpdir_tmpfile():
     print("Testing utils.get_tmpdir, get_tmpfile")
 
@@ -146,3 +184,363 @@ def test_make_targz_files_with_same_content_generates_same_hash(tmp_path):
     hash_tar_2 = utils.get_file_hash(tmp_tar_2)
 
     assert hash_tar_1 == hash_tar_2
+
+
+def test_get_file_digest(tmp_path):
+    print("Testing utils.get_file_digest")
+
+    # Span several read buffers and end on a partial one
+    content = os.urandom(oras.defaults.default_hash_blocksize * 2 + 17)
+    tmpfile = tmp_path / "blob.bin"
+    tmpfile.write_bytes(content)
+
+    size, digest = utils.get_file_digest(str(tmpfile))
+    assert size == len(content) == utils.get_size(str(tmpfile))
+    assert digest == hashlib.sha256(content).hexdigest()
+    assert utils.get_file_hash(str(tmpfile)) == digest
+
+    empty = tmp_path / "empty"
+    empty.touch()
+    size, digest = utils.get_file_digest(str(empty))
+    assert size == 0
+    assert "sha256:" + digest == oras.defaults.blank_hash
+
+
+def test_extract_targz_stream(tmp_path):
+    print("Testing utils.extract_targz_stream")
+
+    source = tmp_path / "source"
+    (source / "nested").mkdir(parents=True)
+    utils.write_file(str(source / "nested" / "file.txt"), "hello!")
+    os.chmod(source / "nested", 0o555)
+    targz = utils.make_targz(str(source), str(tmp_path / "source.tar.gz"))
+    os.chmod(source / "nested", 0o755)
+
+    # Read it in small, uneven chunks as a download would arrive
+    with open(targz, "rb") as fd:
+        content = fd.read()
+    chunks = [content[i : i + 1000] for i in range(0, len(content), 1000)]
+    reader = utils.HashingReader(chunks)
+    outdir = tmp_path / "out"
+    utils.extract_targz_stream(reader, str(outdir))
+    reader.drain()
+    assert reader.hexdigest() == hashlib.sha256(content).hexdigest()
+    assert utils.read_file(str(outdir / "source" / "nested" / "file.txt")) == "hello!"
+    assert os.stat(outdir / "source" / "nested").st_mode & 0o777 == 0o555
+    os.chmod(outdir / "source" / "nested", 0o755)
+
+    # A member outside of the output directory is refused
+    evil = tmp_path / "evil.tar.gz"
+    with tarfile.open(evil, "w:gz") as tar:
+        tar.add(str(source / "nested" / "file.txt"), arcname="../escaped.txt")
+    with open(evil, "rb") as fd:
+        with pytest.raises(Exception, match="Path Traversal"):
+            utils.extract_targz_stream(fd, str(outdir))
+    assert not (tmp_path / "escaped.txt").exists()
+
+
+def test_stream_targz(tmp_path):
+    print("Testing utils.stream_targz")
+
+    source = tmp_path / "source"
+    source.mkdir()
+    for i in range(3):
+        (source / f"{i}.bin").write_bytes(os.urandom(1024 * 64))
+    targz = utils.make_targz(str(source), str(tmp_path / "source.tar.gz"))
+
+    with utils.stream_targz(str(source)) as stream:
+        content = stream.read()
+    assert hashlib.sha256(content).hexdigest() == utils.get_file_hash(targz)
+
+    # Stopping early does not leave the writer blocked
+    with utils.stream_targz(str(source)) as stream:
+        stream.read(10)
+    with pytest.raises(FileNotFoundError):
+        with utils.stream_targz(str(tmp_path / "missing")) as stream:
+            stream.read()
+
+
+def test_parallel_gzip(tmp_path):
+    print("Testing utils.compression.ParallelGzipFile")
+
+    # Mix compressible and random data over many blocks and a partial one
+    content = (b"oras " * 100000 + os.urandom(100000)) * 3 + b"end"
+
+    outputs = []
+    for threads in [2, 8]:
+        out = io.BytesIO()
+        with ParallelGzipFile(out, threads=threads, block_size=65536) as gz:
+            for i in range(0, len(content), 10000):
+                gz.write(content[i : i + 10000])
+            assert gz.tell() == len(content)
+        outputs.append(out.getvalue())
+
+    # The output is valid gzip, checked against the crc and size trailer
+    assert gzip.decompress(outputs[0]) == content
+    assert outputs[0] == outputs[1]
+    assert gzip.decompress(_parallel_gzip(b"")) == b""
+
+    # Directory archives are reproducible too
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "file.txt").write_bytes(content)
+    first = utils.make_targz(str(source), str(tmp_path / "1.tar.gz"), 4)
+    second = utils.make_targz(str(source), str(tmp_path / "2.tar.gz"), 3)
+    assert utils.get_file_hash(first) == utils.get_file_hash(second)
+    with tarfile.open(first, "r:gz") as tar:
+        assert tar.extractfile("source/file.txt").read() == content
+
+
+def _parallel_gzip(content):
+    out = io.BytesIO()
+    with ParallelGzipFile(out) as gz:
+        gz.write(content)
+    return out.getvalue()
+
+
+@pytest.mark.skipif(not has_zstd(), reason="zstd is not available")
+def test_zstd_targz(tmp_path):
+    print("Testing zstd compressed archives")
+
+    source = tmp_path / "source"
+    (source / "nested").mkdir(parents=True)
+    content = b"oras " * 100000 + os.urandom(1024)
+    (source / "nested" / "file.bin").write_bytes(content)
+
+    archive = utils.make_targz(str(source), compression="zstd")
+    with utils.stream_targz(str(source), compression="zstd") as stream:
+        streamed = stream.read()
+    with open(archive, "rb") as fd:
+        assert fd.read() == streamed
+    assert streamed.startswith(b"\x28\xb5\x2f\xfd")
+
+    utils.extract_targz(archive, str(tmp_path / "out"), compression="zstd")
+    assert (tmp_path / "out" / "source" / "nested" / "file.bin").read_bytes() == content
+    os.remove(archive)
+
+    with pytest.raises(ValueError):
+        utils.make_targz(str(source), str(tmp_path / "x.tar"), compression="bz2")
+
+
+def test_compression_levels(tmp_path):
+    print("Testing compression levels and plain tar archives")
+
+    text = tmp_path / "text"
+    text.mkdir()
+    (text / "file.txt").write_bytes(b"oras " * 100000)
+    random = tmp_path / "random"
+    random.mkdir()
+    (random / "data.bin").write_bytes(os.urandom(1024 * 256))
+    (tmp_path / "empty").mkdir()
+
+    assert is_compressible(str(text))
+    assert not is_compressible(str(random))
+    assert is_compressible(str(tmp_path / "empty"))
+
+    fast = utils.make_targz(str(text), str(tmp_path / "1.tar.gz"), compression_level=1)
+    best = utils.make_targz(str(text), str(tmp_path / "9.tar.gz"))
+    assert utils.get_size(fast) > utils.get_size(best)
+
+    plain = utils.make_targz(str(random), compression="none")
+    assert plain.endswith(".tar")
+    with tarfile.open(plain, "r:") as tar:
+        assert tar.getnames() == ["random", "random/data.bin"]
+    utils.extract_targz(plain, str(tmp_path / "out"), compression="none")
+    assert (tmp_path / "out" / "random" / "data.bin").read_bytes() == (
+        random / "data.bin"
+    ).read_bytes()
+    os.remove(plain)
+
+
+def test_make_targz_reproducible(tmp_path):
+    print("Testing the same tree gives the same archive")
+
+    digests = []
+    for name, names, mode, mtime in [
+        ("first", ["a", "b", "sub/c"], 0o644, 1000),
+        ("second", ["sub/c", "b", "a"], 0o664, 2000),
+    ]:
+        root = tmp_path / name / "layer"
+        (root / "sub").mkdir(parents=True)
+        for filename in names:
+            path = root / filename
+            path.write_text(filename)
+            path.chmod(mode)
+            os.utime(path, (mtime, mtime))
+        (root / "run.sh").write_text("echo oras")
+        (root / "run.sh").chmod(0o755 if name == "first" else 0o4775)
+        os.symlink("a", root / "link")
+        archive = utils.make_targz(str(root), str(tmp_path / f"{name}.tar.gz"))
+        digests.append(utils.get_file_hash(archive))
+
+    assert digests[0] == digests[1]
+    with tarfile.open(str(tmp_path / "first.tar.gz"), "r:gz") as tar:
+        members = tar.getmembers()
+    assert [m.name for m in members] == sorted(m.name for m in members)
+    modes = {m.name: m.mode for m in members}
+    assert modes["layer/a"] == 0o644
+    assert modes["layer/run.sh"] == 0o755
+    assert modes["layer/sub"] == 0o755
+    assert modes["layer/link"] == 0o777
+
+    # Private files stay private
+    private = tmp_path / "private"
+    private.mkdir()
+    (private / "key").write_text("secret")
+    (private / "key").chmod(0o600)
+    archive = utils.make_targz(str(private), str(tmp_path / "private.tar.gz"))
+    with tarfile.open(archive, "r:gz") as tar:
+        assert tar.getmember("private/key").mode == 0o600
+    assert all(m.uid == 0 and m.uname == "" and m.mtime == 0 for m in members)
+
+
+def test_extract_targz_parallel(tmp_path, monkeypatch):
+    print("Testing utils.extract_targz with several workers")
+
+    # Many small files, a large one, links and a path that is written twice
+    archive = str(tmp_path / "archive.tar.gz")
+    with tarfile.open(archive, "w:gz") as tar:
+
+        def add(name, data=b"", **attrs):
+            info = tarfile.TarInfo(name)
+            for key, value in attrs.items():
+                setattr(info, key, value)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+        add("artifact", type=tarfile.DIRTYPE, mode=0o755)
+        for i in range(200):
+            add(f"artifact/{i % 7}/file-{i}.txt", f"content {i}".encode(), mode=0o640)
+        add("artifact/large.bin", os.urandom(1024 * 64), mode=0o644)
+        add("artifact/twice.txt", b"first")
+        add("artifact/twice.txt", b"second")
+        add("artifact/link", type=tarfile.SYMTYPE, linkname="twice.txt")
+        add("artifact/hard", type=tarfile.LNKTYPE, linkname="artifact/0/file-0.txt")
+        add("artifact/readonly", type=tarfile.DIRTYPE, mode=0o555)
+        add("artifact/readonly/file.txt", b"inside")
+
+    def snapshot(root):
+        found = {}
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                with open(path, "rb") as fd:
+                    found[os.path.relpath(path, root)] = (
+                        fd.read(),
+                        os.stat(path).st_mode,
+                    )
+        return found
+
+    monkeypatch.setattr(oras.defaults, "default_extract_inline_size", 1024)
+    utils.extract_targz(archive, str(tmp_path / "serial"))
+    utils.extract_targz(archive, str(tmp_path / "parallel"), max_workers=4)
+    serial = snapshot(str(tmp_path / "serial"))
+    assert len(serial) == 205
+    assert serial == snapshot(str(tmp_path / "parallel"))
+    assert serial[os.path.join("artifact", "twice.txt")][0] == b"second"
+    assert os.path.islink(tmp_path / "parallel" / "artifact" / "link")
+    mode = os.stat(tmp_path / "parallel" / "artifact" / "readonly").st_mode
+    assert mode & 0o777 == 0o555
+
+    # Traversal protection still applies
+    evil = str(tmp_path / "evil.tar.gz")
+    with tarfile.open(evil, "w:gz") as tar:
+        info = tarfile.TarInfo("../escaped.txt")
+        tar.addfile(info, io.BytesIO(b""))
+    with pytest.raises(Exception, match="Path Traversal"):
+        utils.extract_targz(evil, str(tmp_path / "parallel"), max_workers=4)
+    assert not (tmp_path / "escaped.txt").exists()
+
+
+def test_tar_member_validator(tmp_path):
+    print("Testing utils.TarMemberValidator")
+
+    outdir = str(tmp_path / "out")
+    validator = utils.TarMemberValidator(outdir)
+
+    def member(name, type=tarfile.REGTYPE, linkname=""):
+        info = tarfile.TarInfo(name)
+        info.type = type
+        info.linkname = linkname
+        return info
+
+    assert validator.check(member("a/b.txt")) == os.path.join(outdir, "a", "b.txt")
+    assert validator.check(member("a/../b.txt")) == os.path.join(outdir, "b.txt")
+    validator.check(member("a/link", tarfile.SYMTYPE, "../b.txt"))
+    validator.check(member("a/hard", tarfile.LNKTYPE, "a/b.txt"))
+
+    # A sibling that shares the prefix is outside too
+    escapes = [
+        member("../b.txt"),
+        member("/etc/passwd"),
+        member("../out-sibling/b.txt"),
+        member("a/link", tarfile.SYMTYPE, "../../b.txt"),
+        member("link", tarfile.SYMTYPE, "/etc/passwd"),
+        member("hard", tarfile.LNKTYPE, "../b.txt"),
+    ]
+    for escape in escapes:
+        with pytest.raises(Exception, match="Path Traversal"):
+            validator.check(escape)
+
+    # A link escape is refused before anything is written through it
+    evil = str(tmp_path / "evil.tar.gz")
+    with tarfile.open(evil, "w:gz") as tar:
+        tar.addfile(member("link", tarfile.SYMTYPE, str(tmp_path)))
+        tar.addfile(member("link/escaped.txt"), io.BytesIO(b""))
+    with pytest.raises(Exception, match="Path Traversal"):
+        utils.extract_targz(evil, outdir)
+    assert not (tmp_path / "escaped.txt").exists()
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_extract_targz_chained_symlinks(tmp_path, max_workers):
+    print("Testing links that only escape through earlier links are refused")
+
+    def member(name, type=tarfile.REGTYPE, linkname="", data=b""):
+        info = tarfile.TarInfo(name)
+        info.type = type
+        info.linkname = linkname
+        info.size = len(data)
+        return info, io.BytesIO(data) if type == tarfile.REGTYPE else None
+
+    # Each name is fine as a string, d/d/d is only outdir once d -> . exists
+    outdir = tmp_path / "out" / "inner"
+    evil = str(tmp_path / "evil.tar.gz")
+    with tarfile.open(evil, "w:gz") as tar:
+        tar.addfile(*member("d", tarfile.SYMTYPE, "."))
+        tar.addfile(*member("l", tarfile.SYMTYPE, "d/d/d/../.."))
+        tar.addfile(*member("l/ESCAPED", data=b"escaped"))
+    with pytest.raises(Exception, match="Path Traversal"):
+        utils.extract_targz(evil, str(outdir), max_workers=max_workers)
+    assert not (tmp_path / "ESCAPED").exists()
+    assert not (tmp_path / "out" / "ESCAPED").exists()
+
+    # A file is not written through a symlink already in the directory
+    shutil.rmtree(outdir)
+    outdir.mkdir()
+    os.symlink(str(tmp_path / "outside.txt"), str(outdir / "file.txt"))
+    with tarfile.open(evil, "w:gz") as tar:
+        tar.addfile(*member("file.txt", data=b"escaped"))
+    with pytest.raises(Exception, match="Path Traversal"):
+        utils.extract_targz(evil, str(outdir), max_workers=max_workers)
+    assert not (tmp_path / "outside.txt").exists()
+
+    # A hardlink to a symlink is a symlink relative to its own directory
+    shutil.rmtree(outdir)
+    with tarfile.open(evil, "w:gz") as tar:
+        tar.addfile(*member("a/b", tarfile.DIRTYPE))
+        tar.addfile(*member("a/b/link", tarfile.SYMTYPE, "../.."))
+        tar.addfile(*member("a/hard", tarfile.LNKTYPE, "a/b/link"))
+    with pytest.raises(Exception, match="Path Traversal"):
+        utils.extract_targz(evil, str(outdir), max_workers=max_workers)
+    assert not (outdir / "a" / "hard").exists()
+
+    # Links that stay inside are still extracted
+    shutil.rmtree(outdir)
+    with tarfile.open(evil, "w:gz") as tar:
+        tar.addfile(*member("d", tarfile.SYMTYPE, "."))
+        tar.addfile(*member("sub", tarfile.DIRTYPE))
+        tar.addfile(*member("sub/up", tarfile.SYMTYPE, "../d/sub"))
+        tar.addfile(*member("sub/up/file.txt", data=b"inside"))
+    utils.extract_targz(evil, str(outdir), max_workers=max_workers)
+    assert (outdir / "sub" / "file.txt").read_bytes() == b"inside"
@@ -1,12 +1,19 @@
 from .fileio import (
+    DigestMismatchError,
+    HashingReader,
+    TarMemberValidator,
+    clone_file,
     copyfile,
     extract_targz,
+    extract_targz_stream,
+    get_file_digest,
     get_file_hash,
     get_size,
     get_tmpdir,
     get_tmpfile,
     make_targz,
     mkdir_p,
+    move_tree,
     print_json,
     read_file,
     read_in_chunks,
@@ -15,9 +22,12 @@ from .fileio import (
     recursive_find,
     sanitize_path,
     split_path_and_content,
+    stream_targz,
+    update_file_hash,
     workdir,
     write_file,
     write_json,
+    write_targz,
 )
 from .request import (
     append_url_params,
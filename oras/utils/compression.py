@@ -0,0 +1,245 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright The ORAS Authors."
+__license__ = "Apache-2.0"
+
+import collections
+import os
+import struct
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Deque
+
+import oras.defaults
+
+# Deflate can refer back up to this many bytes, so each block is primed
+# with the end of the previous one as a dictionary (like pigz).
+window_size = 32768
+
+
+def _compress_block(data: bytes, zdict: bytes, level: int) -> bytes:
+    """
+    Raw deflate a block, ending on a byte boundary so blocks can be joined.
+
+    :param data: the block to compress
+    :type data: bytes
+    :param zdict: the end of the previous block, to keep the compression ratio
+    :type zdict: bytes
+    :param level: compression level, 1 to 9
+    :type level: int
+    """
+    if zdict:
+        compressor = zlib.compressobj(
+            level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict
+        )
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipFile:
+    """
+    A write-only gzip stream that compresses blocks on a pool of threads.
+
+    The input is cut into blocks of block_size that are deflated on their own
+    (zlib releases the GIL) and joined in order, giving a single valid gzip
+    member. The output only depends on the content, block size and level, not
+    on the number of threads, so it is reproducible. It is not the same as the
+    output of gzip.GzipFile. As with gzip.GzipFile, closing it does not close
+    the underlying fileobj.
+    """
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        threads: int = 2,
+        level: int = oras.defaults.default_gzip_level,
+        block_size: int = oras.defaults.default_compression_blocksize,
+    ):
+        """
+        :param fileobj: the writable binary stream for the compressed output
+        :param threads: number of threads to compress with
+        :type threads: int
+        :param level: compression level, 1 to 9
+        :type level: int
+        :param block_size: size of the uncompressed blocks
+        :type block_size: int
+        """
+        self.fileobj = fileobj
+        self.level = level
+        self.block_size = block_size
+        self.threads = max(1, threads)
+        self._executor = ThreadPoolExecutor(max_workers=self.threads)
+        self._pending: Deque[Future] = collections.deque()
+        self._buffer = bytearray()
+        self._zdict = b""
+        self._crc = 0
+        self._size = 0
+        self.closed = False
+
+        # Same header as gzip.GzipFile with mtime=0, without a filename
+        xfl = 2 if level == 9 else 4 if level == 1 else 0
+        self.fileobj.write(b"\x1f\x8b\x08\x00" + struct.pack("<IBB", 0, xfl, 255))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def tell(self) -> int:
+        """
+        Return the uncompressed position, like gzip.GzipFile.
+        """
+        return self._size
+
+    def write(self, data) -> int:
+        """
+        Add data to compress, submitting each full block.
+        """
+        if self.closed:
+            raise ValueError("write to closed file")
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[: self.block_size])
+            del self._buffer[: self.block_size]
+            self._submit(block)
+        return len(data)
+
+    def _submit(self, block: bytes):
+        """
+        Compress a block on the pool, writing out finished blocks in order.
+        """
+        self._pending.append(
+            self._executor.submit(_compress_block, block, self._zdict, self.level)
+        )
+        self._zdict = block[-window_size:]
+
+        # Keep a bounded number of blocks in memory
+        while len(self._pending) > self.threads * 2:
+            self.fileobj.write(self._pending.popleft().result())
+
+    def close(self):
+        """
+        Compress what is left and write the end of the stream.
+        """
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().result())
+
+            # An empty final block ends the deflate stream
+            self.fileobj.write(
+                zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS).flush()
+            )
+            self.fileobj.write(
+                struct.pack("<II", self._crc & 0xFFFFFFFF, self._size & 0xFFFFFFFF)
+            )
+        finally:
+            self.closed = True
+            for future in self._pending:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+
+
+def get_zstd() -> Any:
+    """
+    Import zstd support, from the standard library (3.14+) or zstandard.
+    """
+    try:
+        from compression import zstd  # type: ignore
+
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "zstd compression needs Python 3.14+ or zstandard: pip install oras[zstd]"
+        )
+    return zstandard
+
+
+def zstd_writer(
+    fileobj: BinaryIO,
+    level: int = oras.defaults.default_zstd_level,
+    threads: int = 1,
+) -> Any:
+    """
+    Get a writable stream that zstd compresses into fileobj.
+
+    Closing it ends the frame, but does not close fileobj.
+
+    :param fileobj: the writable binary stream for the compressed output
+    :param level: compression level
+    :type level: int
+    :param threads: number of threads to compress with
+    :type threads: int
+    """
+    zstd = get_zstd()
+    if zstd.__name__ == "compression.zstd":
+        options = {zstd.CompressionParameter.compression_level: level}
+        if threads > 1:
+            options[zstd.CompressionParameter.nb_workers] = threads
+        return zstd.ZstdFile(fileobj, "w", options=options)
+    compressor = zstd.ZstdCompressor(level=level, threads=threads if threads > 1 else 0)
+    return compressor.stream_writer(fileobj, closefd=False)
+
+
+def zstd_reader(fileobj: BinaryIO) -> Any:
+    """
+    Get a readable stream of the zstd decompressed content of fileobj.
+
+    :param fileobj: a readable binary stream of zstd compressed content
+    """
+    zstd = get_zstd()
+    if zstd.__name__ == "compression.zstd":
+        return zstd.ZstdFile(fileobj, "r")
+    return zstd.ZstdDecompressor().stream_reader(
+        fileobj, read_across_frames=True, closefd=False
+    )
+
+
+def is_compressible(source_dir: str) -> bool:
+    """
+    Guess if compressing a directory is worth it from a sample of its files.
+
+    The start of each file, in a stable order, is compressed at a fast level
+    until we have sampled enough. Already compressed content (e.g., parquet,
+    zstd or media files) does not get below the minimum ratio.
+
+    :param source_dir: the directory to sample
+    :type source_dir: str
+    """
+    sample = bytearray()
+    total = oras.defaults.default_compression_sample_total
+    for root, dirnames, filenames in os.walk(source_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(root, filename)
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            with open(path, "rb") as fd:
+                sample += fd.read(
+                    min(
+                        oras.defaults.default_compression_sample_size,
+                        total - len(sample),
+                    )
+                )
+            if len(sample) >= total:
+                break
+        else:
+            continue
+        break
+
+    # There is nothing to lose compressing (nearly) nothing
+    if not sample:
+        return True
+    ratio = len(zlib.compress(bytes(sample), 1)) / len(sample)
+    return ratio < oras.defaults.default_compression_min_ratio
@@ -2,6 +2,7 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright The ORAS Authors."
 __license__ = "Apache-2.0"
 
+import collections
 import errno
 import gzip
 import hashlib
@@ -15,8 +16,24 @@ import stat
 import sys
 import tarfile
 import tempfile
-from contextlib import contextmanager
-from typing import Generator, Optional, TextIO, Union
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import (
+    BinaryIO,
+    Deque,
+    Dict,
+    Generator,
+    Iterable,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+import oras.defaults
+import oras.utils.compression
 
 
 class PathAndOptionalContent:
@@ -27,32 +44,233 @@ class PathAndOptionalContent:
         self.content = content
 
 
+class DigestMismatchError(ValueError):
+    """
+    Raised when downloaded content does not match its expected digest.
+    """
+
+    def __init__(self, name: str, expected: str, actual: str):
+        self.name = name
+        self.expected = expected
+        self.actual = actual
+        super().__init__(
+            f"Digest mismatch for {name}: expected {expected}, got {actual}"
+        )
+
+
 def reset(tarinfo):
-    """Helper to reset modification time for tar entries"""
+    """
+    Helper to normalize tar entries, so the same tree gives the same archive.
+
+    The modification time and owner are cleared. Group and other write, setuid,
+    setgid and sticky bits are masked out of the mode, so the umask does not
+    matter, without making private files readable. Symlinks get 0o777, as on
+    Linux.
+    """
     tarinfo.mtime = 0
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = ""
+    tarinfo.mode = 0o777 if tarinfo.issym() else tarinfo.mode & 0o755
     return tarinfo
 
 
-def make_targz(source_dir: str, dest_name: Optional[str] = None) -> str:
+def make_targz(
+    source_dir: str,
+    dest_name: Optional[str] = None,
+    compression_threads: int = 1,
+    compression: str = "gzip",
+    compression_level: Optional[int] = None,
+) -> str:
     """
-    Make a reproducible (no mtime) targz (compressed) archive from a source directory.
+    Make a reproducible targz (compressed) archive from a source directory.
+
+    See write_targz for the compression options.
     """
-    dest_name = dest_name or get_tmpfile(suffix=".tar.gz")
+    suffix = {"zstd": ".tar.zst", "none": ".tar"}.get(compression, ".tar.gz")
+    dest_name = dest_name or get_tmpfile(suffix=suffix)
 
     # os.O_WRONLY tells the computer you are only going to writo to the file, not read
     # os.O_CREATE tells the computer to create the file if it doesn't exist
     with os.fdopen(
         os.open(dest_name, os.O_WRONLY | os.O_CREAT, 0o644), "wb"
     ) as out_file:
-        with gzip.GzipFile(mode="wb", fileobj=out_file, mtime=0) as gzip_file:
-            with tarfile.open(fileobj=gzip_file, mode="w:") as tar_file:
-                tar_file.add(
-                    source_dir, filter=reset, arcname=os.path.basename(source_dir)
-                )
+        write_targz(
+            source_dir, out_file, compression_threads, compression, compression_level
+        )
 
     return dest_name
 
 
+def write_targz(
+    source_dir: str,
+    fileobj: BinaryIO,
+    compression_threads: int = 1,
+    compression: str = "gzip",
+    compression_level: Optional[int] = None,
+):
+    """
+    Write a reproducible targz archive of a directory to a stream.
+
+    Entries are added in sorted order (tarfile sorts directory listings) and
+    normalized with reset, in the pax format whatever the Python version, so
+    the same content gives the same digest on any machine.
+
+    The stream is only written to, in order, so it can be a pipe. With more
+    than one compression thread, blocks are compressed in parallel. That
+    output is reproducible too, but it differs from the single threaded one.
+
+    :param source_dir: the directory to archive
+    :type source_dir: str
+    :param fileobj: a writable binary stream
+    :param compression_threads: number of threads to compress with
+    :type compression_threads: int
+    :param compression: gzip, zstd (requires Python 3.14+ or zstandard), or none
+                        for a plain tar
+    :type compression: str
+    :param compression_level: compression level, by default 9 for gzip and 3
+                              for zstd
+    :type compression_level: int
+    """
+    if compression_level is None:
+        compression_level = (
+            oras.defaults.default_zstd_level
+            if compression == "zstd"
+            else oras.defaults.default_gzip_level
+        )
+    if compression == "zstd":
+        compressed = oras.utils.compression.zstd_writer(
+            fileobj,
+            level=compression_level,
+            threads=compression_threads,
+        )
+    elif compression == "none":
+        compressed = nullcontext(fileobj)
+    elif compression != "gzip":
+        raise ValueError(f"Unsupported compression {compression}")
+    elif compression_threads > 1:
+        compressed = oras.utils.compression.ParallelGzipFile(
+            fileobj,
+            threads=compression_threads,
+            level=compression_level,
+        )
+    else:
+        compressed = gzip.GzipFile(
+            mode="wb",
+            fileobj=fileobj,
+            mtime=0,
+            compresslevel=compression_level,
+        )
+    # A plain tar may go to a pipe, which does not support tell
+    mode = "w|" if compression == "none" else "w:"
+    with compressed as stream:
+        with tarfile.open(  # type: ignore
+            fileobj=stream, mode=mode, format=tarfile.PAX_FORMAT
+        ) as tar_file:
+            tar_file.add(source_dir, filter=reset, arcname=os.path.basename(source_dir))
+
+
+@contextmanager
+def stream_targz(
+    source_dir: str,
+    compression_threads: int = 1,
+    compression: str = "gzip",
+    compression_level: Optional[int] = None,
+) -> Generator[BinaryIO, None, None]:
+    """
+    Provide a readable stream of a reproducible targz of a directory, e.g.,
+
+    with stream_targz(dirname) as stream:
+       # read the archive from stream
+
+    A thread writes the archive into a pipe as it is read, so it is never
+    stored. An error writing the archive is raised when the context exits.
+    See write_targz for the compression options.
+    """
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def write():
+        try:
+            with os.fdopen(write_fd, "wb") as out_file:
+                write_targz(
+                    source_dir,
+                    out_file,
+                    compression_threads,
+                    compression,
+                    compression_level,
+                )
+        except BrokenPipeError:
+            # The reader stopped early, that is up to them
+            pass
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=write, daemon=True)
+    thread.start()
+    stream = os.fdopen(read_fd, "rb")
+    try:
+        yield stream
+    finally:
+        # Closing our end stops a writer that is blocked on a full pipe
+        stream.close()
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def clone_file(source: str, destination: str, hardlink: bool = False) -> str:
+    """
+    Place a copy of a file at a destination as cheaply as we can.
+
+    We first try a reflink (copy-on-write clone, e.g., btrfs or xfs), then a
+    hardlink if allowed, and otherwise fall back to a regular copy. A hardlink
+    shares the inode, so changing one file in place changes the other. The
+    destination is replaced atomically.
+
+    :param source: the file to copy
+    :type source: str
+    :param destination: the path to place the copy at
+    :type destination: str
+    :param hardlink: allow a hardlink when a reflink is not possible
+    :type hardlink: bool
+    """
+    tmp = f"{destination}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        if not _reflink(source, tmp):
+            try:
+                if not hardlink:
+                    raise OSError("hardlinks are not allowed")
+                os.link(source, tmp)
+            except OSError:
+                shutil.copyfile(source, tmp)
+        os.replace(tmp, destination)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return destination
+
+
+def _reflink(source: str, destination: str) -> bool:
+    """
+    Clone a file with the Linux FICLONE ioctl, returning False if unsupported.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    if not sys.platform.startswith("linux"):
+        return False
+    ficlone = 0x40049409
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), ficlone, src.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(destination)
+    return False
+
+
 def sanitize_path(expected_dir, path):
     """
     Ensure a path resolves to be in the expected parent directory.
@@ -91,16 +309,286 @@ def readline() -> str:
     return content[0].strip()
 
 
-def extract_targz(targz: str, outdir: str, numeric_owner: bool = False):
-    """
-    Extract a .tar.gz to an output directory.
-    """
-    with tarfile.open(targz, "r:gz") as tar:
-        for member in tar.getmembers():
-            member_path = os.path.join(outdir, member.name)
-            if not is_within_directory(outdir, member_path):
-                raise Exception("Attempted Path Traversal in Tar File")
-        tar.extractall(outdir, members=None, numeric_owner=numeric_owner)
+def extract_targz(
+    targz: str,
+    outdir: str,
+    numeric_owner: bool = False,
+    compression: str = "gzip",
+    max_workers: int = 1,
+):
+    """
+    Extract a .tar.gz (or a .tar.zst or .tar, see compression) to an output directory.
+
+    The archive is checked and extracted in a single pass, see extract_targz_stream.
+    """
+    with open(targz, "rb") as fd:
+        extract_targz_stream(fd, outdir, numeric_owner, compression, max_workers)
+
+
+class TarMemberValidator:
+    """
+    Check that tar members stay inside an output directory.
+
+    Each member name gets a normpath and a prefix check. That is not enough
+    once the archive (or the directory) has symlinks, since a later member
+    can be written through a link an earlier one created, so we also ask the
+    filesystem where the parent directory of each member resolves to, as it
+    is when the member is extracted. Symlink and hardlink targets have to
+    resolve inside the directory too, so a link cannot be used to write (or
+    later read) outside of it. Resolved directories are cached until a link
+    is added, to keep this to a few system calls per member.
+    """
+
+    def __init__(self, outdir: str):
+        """
+        :param outdir: the directory members are extracted to
+        :type outdir: str
+        """
+        self.base = os.path.abspath(outdir)
+        self.prefix = os.path.join(self.base, "")
+        self.real_base = os.path.realpath(self.base)
+        self.real_prefix = os.path.join(self.real_base, "")
+        self._resolved: Dict[str, str] = {}
+
+    def is_within(self, path: str) -> bool:
+        """
+        Determine if a normalized path is the directory or inside it.
+        """
+        return path == self.base or path.startswith(self.prefix)
+
+    def is_within_real(self, path: str) -> bool:
+        """
+        Determine if a resolved path is the directory or inside it.
+        """
+        return path == self.real_base or path.startswith(self.real_prefix)
+
+    def resolve_dir(self, path: str) -> str:
+        """
+        Get where a directory really is, following symlinks.
+
+        :param path: a normalized directory path inside the output directory
+        :type path: str
+        """
+        resolved = self._resolved.get(path)
+        if resolved is None:
+            resolved = self._resolved[path] = os.path.realpath(path)
+        return resolved
+
+    def check(self, member: tarfile.TarInfo) -> str:
+        """
+        Return the output path of a member, raising an error if it escapes.
+
+        This has to be called right before the member is extracted, once
+        the members before it are.
+
+        :param member: the tar member to check
+        :type member: tarfile.TarInfo
+        """
+        path = os.path.normpath(os.path.join(self.base, member.name))
+        if not self.is_within(path):
+            raise Exception("Attempted Path Traversal in Tar File")
+        if path == self.base:
+            return path
+
+        # Where it will really be written, a symlink is replaced but anything
+        # else is written through an existing one
+        parent = self.resolve_dir(os.path.dirname(path))
+        real = os.path.join(parent, os.path.basename(path))
+        if not member.issym() and os.path.islink(real):
+            real = os.path.realpath(real)
+        if not self.is_within_real(real):
+            raise Exception("Attempted Path Traversal in Tar File")
+
+        if member.issym():
+            target = os.path.join(os.path.dirname(path), member.linkname)
+            real_target = os.path.realpath(os.path.join(parent, member.linkname))
+        elif member.islnk():
+            target = os.path.join(self.base, member.linkname)
+            real_target = os.path.realpath(target)
+
+            # A hardlink to a symlink is a copy of it, relative to where it is
+            if os.path.islink(target):
+                linked = os.path.join(parent, os.readlink(target))
+                if not self.is_within_real(os.path.realpath(linked)):
+                    raise Exception("Attempted Path Traversal in Tar File (link)")
+        else:
+            return path
+        if not self.is_within(os.path.normpath(target)) or not self.is_within_real(
+            real_target
+        ):
+            raise Exception("Attempted Path Traversal in Tar File (link)")
+
+        # Directories may resolve elsewhere once the link exists
+        self._resolved.clear()
+        return path
+
+
+def extract_targz_stream(
+    fileobj,
+    outdir: str,
+    numeric_owner: bool = False,
+    compression: str = "gzip",
+    max_workers: int = 1,
+):
+    """
+    Extract a .tar.gz as it is read from a stream to an output directory.
+
+    Each member (and link target) is checked for path traversal before it is
+    extracted, so the archive never has to be written to disk. As with extractall, the
+    attributes of directories are set at the end, in case they would not
+    allow writing the files inside them.
+
+    With more than one worker, the archive is still read in order, but small
+    files are written (and get their attributes) on a pool of threads, which
+    helps with many small files on slow or network filesystems.
+
+    :param fileobj: a readable binary stream of the .tar.gz
+    :param outdir: the directory to extract to
+    :type outdir: str
+    :param numeric_owner: use uid and gid numbers instead of names
+    :type numeric_owner: bool
+    :param compression: gzip, zstd (requires Python 3.14+ or zstandard), or none
+    :type compression: str
+    :param max_workers: number of threads to write files with
+    :type max_workers: int
+    """
+    if compression == "zstd":
+        fileobj, mode = oras.utils.compression.zstd_reader(fileobj), "r|"
+    elif compression == "none":
+        mode = "r|"
+    elif compression == "gzip":
+        mode = "r|gz"
+    else:
+        raise ValueError(f"Unsupported compression {compression}")
+
+    validator = TarMemberValidator(outdir)
+    directories = []
+    pending: Deque[Future] = collections.deque()
+    pending_paths: Set[str] = set()
+    executor = ThreadPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+    try:
+        with tarfile.open(fileobj=fileobj, mode=mode) as tar:  # type: ignore
+            for member in tar:
+                member_path = validator.check(member)
+                if member.isdir():
+                    directories.append(member)
+
+                # Small files are read here and written on the pool
+                if (
+                    executor
+                    and member.isreg()
+                    and not member.issparse()
+                    and member.size <= oras.defaults.default_extract_inline_size
+                ):
+                    # A later member with the same path has to win
+                    if member_path in pending_paths:
+                        while pending:
+                            pending.popleft().result()
+                        pending_paths.clear()
+                    pending_paths.add(member_path)
+                    os.makedirs(os.path.dirname(member_path), exist_ok=True)
+                    data = tar.extractfile(member).read()  # type: ignore
+                    pending.append(
+                        executor.submit(
+                            _write_member, tar, member, member_path, data, numeric_owner
+                        )
+                    )
+                    while len(pending) > max_workers * 4:
+                        pending.popleft().result()
+                    continue
+
+                # Anything else may depend on files written before it (e.g., a
+                # hardlink), so those are finished first
+                while pending:
+                    pending.popleft().result()
+                pending_paths.clear()
+                tar.extract(
+                    member,
+                    outdir,
+                    set_attrs=not member.isdir(),
+                    numeric_owner=numeric_owner,
+                )
+            while pending:
+                pending.popleft().result()
+
+            # Deepest directories first, so setting a mode does not block the rest
+            directories.sort(key=lambda member: member.name, reverse=True)
+            for member in directories:
+                dirpath = os.path.join(outdir, member.name)
+                tar.chown(member, dirpath, numeric_owner)
+                tar.utime(member, dirpath)
+                tar.chmod(member, dirpath)
+    finally:
+        if executor:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+
+def _write_member(
+    tar: tarfile.TarFile,
+    member: tarfile.TarInfo,
+    path: str,
+    data: bytes,
+    numeric_owner: bool = False,
+):
+    """
+    Write a regular file from an archive and set its attributes, as tarfile does.
+    """
+    with open(path, "wb") as fd:
+        fd.write(data)
+    tar.chown(member, path, numeric_owner)
+    tar.chmod(member, path)
+    tar.utime(member, path)
+
+
+class HashingReader:
+    """
+    A readable stream over an iterator of chunks that hashes what it yields.
+
+    This lets a consumer like tarfile read a download as a file while the
+    digest of the content is computed along the way.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], algorithm: str = "sha256"):
+        """
+        :param chunks: the chunks of content, e.g., from iter_content
+        :type chunks: iterable of bytes
+        :param algorithm: the algorithm to hash with
+        :type algorithm: str
+        """
+        self._chunks = iter(chunks)
+        self._chunk = b""
+        self._offset = 0
+        self.hasher = hashlib.new(algorithm)
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read up to size bytes, or the rest of the current chunk.
+        """
+        while self._offset >= len(self._chunk):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return b""
+            self._chunk, self._offset = chunk, 0
+            self.hasher.update(chunk)
+        if size < 0:
+            size = len(self._chunk) - self._offset
+        data = self._chunk[self._offset : self._offset + size]
+        self._offset += len(data)
+        return data
+
+    def drain(self):
+        """
+        Consume (and hash) anything that was not read, e.g., tar padding.
+        """
+        for chunk in self._chunks:
+            self.hasher.update(chunk)
+        self._chunk = b""
+        self._offset = 0
+
+    def hexdigest(self) -> str:
+        return self.hasher.hexdigest()
 
 
 def is_within_directory(directory: str, target: str) -> bool:
@@ -133,11 +621,47 @@ def get_file_hash(path: str, algorithm: str = "sha256") -> str:
     :param algorithm: the algorithm to use
     :type algorithm: str
     """
+    return get_file_digest(path, algorithm)[1]
+
+
+def get_file_digest(path: str, algorithm: str = "sha256") -> Tuple[int, str]:
+    """
+    Return the size and hex digest of a file, reading it a single time.
+
+    The file is read into one large reusable buffer, so hashing a large
+    blob costs few Python-level iterations and no extra allocations.
+    Raises AttributeError if incorrect algorithm supplied.
+
+    :param path: the path to get the size and digest for
+    :type path: str
+    :param algorithm: the algorithm to use
+    :type algorithm: str
+    """
     hasher = getattr(hashlib, algorithm)()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hasher.update(chunk)
-    return hasher.hexdigest()
+    size = update_file_hash(hasher, path)
+    return size, hasher.hexdigest()
+
+
+def update_file_hash(hasher, path: str) -> int:
+    """
+    Feed the content of a file to a hasher, returning the number of bytes read.
+
+    :param hasher: the hashlib object to update
+    :type hasher: hashlib hash
+    :param path: the path of the file to read
+    :type path: str
+    """
+    buffer = bytearray(oras.defaults.default_hash_blocksize)
+    view = memoryview(buffer)
+    size = 0
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+            size += n
+    return size
 
 
 def mkdir_p(path: str):
@@ -249,6 +773,37 @@ def copyfile(source: str, destination: str, force: bool = True) -> str:
     return destination
 
 
+def move_tree(source: str, destination: str):
+    """
+    Move the contents of a directory into another, merging directories.
+
+    Entries are renamed, so both should be on the same filesystem. As when
+    extracting an archive over it, an existing file is replaced and a merged
+    directory gets the mode and times of the one moved in.
+
+    :param source: the directory to move the contents of
+    :type source: str
+    :param destination: the directory to move them into
+    :type destination: str
+    """
+    for name in os.listdir(source):
+        src = os.path.join(source, name)
+        dst = os.path.join(destination, name)
+        src_is_dir = os.path.isdir(src) and not os.path.islink(src)
+        dst_is_dir = os.path.isdir(dst) and not os.path.islink(dst)
+        if src_is_dir and dst_is_dir:
+            # The extracted mode may not let us move the children out
+            st = os.lstat(src)
+            os.chmod(src, st.st_mode | stat.S_IWUSR)
+            move_tree(src, dst)
+            os.chmod(dst, stat.S_IMODE(st.st_mode))
+            os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+            continue
+        if dst_is_dir:
+            shutil.rmtree(dst)
+        os.replace(src, dst)
+
+
 def write_file(
     filename: str, content: str, mode: str = "w", make_exec: bool = False
 ) -> str:
@@ -2,7 +2,7 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright The ORAS Authors."
 __license__ = "Apache-2.0"
 
-__version__ = "0.2.33"
+__version__ = "0.2.58"
 AUTHOR = "Vanessa Sochat"
 EMAIL = "vsoch@users.noreply.github.com"
 NAME = "oras"
@@ -23,4 +23,9 @@ TESTS_REQUIRES = (("pytest", {"min_version": "4.6.2"}),)
 
 DOCKER_REQUIRES = (("docker", {"exact_version": "5.0.1"}),)
 
-INSTALL_REQUIRES_ALL = INSTALL_REQUIRES + TESTS_REQUIRES + DOCKER_REQUIRES
+# zstd directory layers, built into Python 3.14+
+ZSTD_REQUIRES = (("zstandard", {"min_version": None}),)
+
+INSTALL_REQUIRES_ALL = (
+    INSTALL_REQUIRES + TESTS_REQUIRES + DOCKER_REQUIRES + ZSTD_REQUIRES
+)